@@ -41,6 +41,10 @@ class App(badge.BaseApp):
         # Using a set provides efficient lookup (O(1) on average).
         self.spike_tiles = {17, 27, 43, 59}
 
+        # Tiles and objects are recorded into a display list and drawn in a single call,
+        # instead of going through badge.display (and its app check) hundreds of times a frame.
+        self.dl = badge.display.DrawList(capacity=300)
+
     def loop(self) -> None:
         """
         The main game loop, called repeatedly for each frame.
@@ -74,6 +78,7 @@ class App(badge.BaseApp):
         # Get direct references to PICO8 and Celeste game instances.
         p8 = self.p8
         g = self.p8.game # 'g' refers to the Celeste game instance
+        dl = self.dl
 
         # --- 1. Draw base tiles (walls, ground, spikes) ---
         # Optimized drawing: Only draw black pixels for solid/spike tiles.
@@ -91,7 +96,7 @@ class App(badge.BaseApp):
                     y_pixel = offset_y + (row_idx * tile_display_size)
                     
                     # Draw a filled black square. This is an efficient drawing operation.
-                    badge.display.fill_rect(x_pixel, y_pixel, tile_display_size, tile_display_size, 0)
+                    dl.fill_rect(x_pixel, y_pixel, tile_display_size, tile_display_size, 0)
 
         # --- 2. Draw objects on top of the tiles ---
         # Iterate through all active objects in the game.
@@ -117,24 +122,28 @@ class App(badge.BaseApp):
 
                     # Draw the text representation. `badge.display.text` can be a bottleneck
                     # if font rendering is computationally heavy.
-                    badge.display.text(obj_text, obj_x_pixel, obj_y_pixel, 0)
+                    dl.text(obj_text, obj_x_pixel, obj_y_pixel, 0)
 
                     # Handle drawing additional text for multi-tile objects or visual effects.
                     # These specific checks maintain the visual fidelity of the original Celeste.
                     if type(o) == g.platform and ox_tile + 1 <= 15:
-                        badge.display.text(obj_text, obj_x_pixel + tile_display_size, obj_y_pixel, 0)
+                        dl.text(obj_text, obj_x_pixel + tile_display_size, obj_y_pixel, 0)
                     elif type(o) == g.fly_fruit:
                         if ox_tile - 1 >= 0:
-                            badge.display.text(' »', obj_x_pixel - tile_display_size, obj_y_pixel, 0)
+                            dl.text(' »', obj_x_pixel - tile_display_size, obj_y_pixel, 0)
                         if ox_tile + 1 <= 15:
-                            badge.display.text('« ', obj_x_pixel + tile_display_size, obj_y_pixel, 0)
+                            dl.text('« ', obj_x_pixel + tile_display_size, obj_y_pixel, 0)
                     elif type(o) == g.fake_wall:
                         if ox_tile + 1 <= 15:
-                            badge.display.text(obj_text, obj_x_pixel + tile_display_size, obj_y_pixel, 0)
+                            dl.text(obj_text, obj_x_pixel + tile_display_size, obj_y_pixel, 0)
                         if oy_tile + 1 <= 15:
-                            badge.display.text(obj_text, obj_x_pixel, obj_y_pixel + tile_display_size, 0)
+                            dl.text(obj_text, obj_x_pixel, obj_y_pixel + tile_display_size, 0)
                         if ox_tile + 1 <= 15 and oy_tile + 1 <= 15:
-                            badge.display.text(obj_text, obj_x_pixel + tile_display_size, obj_y_pixel + tile_display_size, 0)
+                            dl.text(obj_text, obj_x_pixel + tile_display_size, obj_y_pixel + tile_display_size, 0)
+
+        # Draw everything recorded above in one go.
+        badge.display.draw(dl)
+        dl.clear()
 
         # Push the rendered frame to the actual display.
         # This is typically the most time-consuming step for many displays, especially e-ink.
@@ -6,8 +6,8 @@ class App(badge.BaseApp):
         self.result = None
         self._was_down = False
         badge.display.fill(1)
-        badge.display.nice_text("Coin flip", 50, 0, font=badge.display.nice_fonts[24])
-        badge.display.nice_text("Press any button to flip", 3, 100, font=badge.display.nice_fonts[18])
+        badge.display.nice_text("Coin flip", 50, 0, font=badge.display.nice_fonts[24], cache=True)
+        badge.display.nice_text("Press any button to flip", 3, 100, font=badge.display.nice_fonts[18], cache=True)
         badge.display.show()
 
     def justdrawit(self, cx: int, cy: int, r: int, color: int) -> None:
@@ -32,9 +32,9 @@ class App(badge.BaseApp):
         f = badge.display.nice_fonts[68]
         tx = cx - (f.max_width // 2)
         ty = cy - (f.height // 2)
-        badge.display.nice_text(mark, tx, ty, font=f, color=0)
+        badge.display.nice_text(mark, tx, ty, font=f, color=0, cache=True)
 
-        badge.display.nice_text("Heads" if heads else "Tails", 72, 170, font=badge.display.nice_fonts[24])
+        badge.display.nice_text("Heads" if heads else "Tails", 72, 170, font=badge.display.nice_fonts[24], cache=True)
         badge.display.show()
 
     def loop(self):
@@ -17,17 +17,21 @@ class App(badge.BaseApp):
         self.old_button_b = False
         self.old_button_l = False
         self.button_time = utime.ticks_ms()
-        self.already_drew_icons = False
-        self.cached_icons = []
-        self.missing_icon = badge.display.import_pbm("/missingtex.pbm")
+        self.missing_icon = None  # only loaded if an app is missing from the icon atlas
+        self.screen = badge.ui.Screen()
+        self.cells = []  # one badge.ui.Icon per app on the current page
+        self.page = -1
+        self.apps_seen = None  # (number of registered apps, icon atlas rebuilds) the cells were built for
 
     def on_open(self) -> None:
         badge.display.fill(1)
-        internal_os.display.display.display_base_image()
+        # full refresh to clear the last app's ghosting; it goes through flush_forever like every other frame
+        badge.display.show(force_full_refresh=True)
         self.logger.info("Home screen opening...")
         self.cursor_pos = 0
+        self.page = -1
+        self.apps_seen = None
         self.render_home_screen()
-        self.already_drew_icons = True
 
     def beep(self) -> None:
         """
@@ -37,6 +41,10 @@ class App(badge.BaseApp):
         badge.utils.set_led_pwm(8192)
 
     def loop(self) -> None:
+        if self.apps_seen != self.get_apps_state():
+            # scan_forever added, removed or changed apps while we're open
+            self.render_home_screen()
+
         if badge.input.get_button(badge.input.Buttons.SW12):
             self.old_button_b = True
         else:
@@ -75,17 +83,30 @@ class App(badge.BaseApp):
             self.old_button_l = False
 
     def render_home_screen(self):
-        """Render the home screen display."""
-        badge.display.fill(1)
-        for i, app in enumerate(self.get_apps_to_show()):
-            current_screen = self.cursor_pos // 6
-            if i < current_screen * 6 or i >= (current_screen + 1) * 6:
-                continue
-            app_x = (i % 3) * 66
-            app_y = (i // 3) * 78 + 12
-            self.draw_app_icon(app, app_x, app_y, self.cursor_pos == i, i)
-        self.logger.debug(f"Cursor position: {self.cursor_pos}, total apps: {len(self.get_apps_to_show())}")
-        badge.display.show()
+        """Render the home screen display. Moving the cursor within a page only redraws the two icons involved."""
+        apps = self.get_apps_to_show()
+        if apps:
+            self.cursor_pos = min(self.cursor_pos, len(apps) - 1)
+        else:
+            self.cursor_pos = 0
+        page = self.cursor_pos // 6
+        apps_state = self.get_apps_state()
+        if page != self.page or apps_state != self.apps_seen:
+            self.page = page
+            self.apps_seen = apps_state
+            self.screen.clear()
+            grid = self.screen.add(badge.ui.Grid(0, 9, cols=3, cell_w=66, cell_h=78, rows=2))
+            self.cells = []
+            for app in apps[page * 6:(page + 1) * 6]:
+                self.cells.append(grid.add(badge.ui.Icon(0, 0, 0, 0, self.get_app_icon(app), 48, 48, caption=app.display_name)))
+        for i, cell in enumerate(self.cells):
+            cell.set_selected(page * 6 + i == self.cursor_pos)
+        self.logger.debug(f"Cursor position: {self.cursor_pos}, total apps: {len(apps)}")
+        self.screen.render()
+
+    def get_apps_state(self):
+        """What the cells depend on besides the page: they're rebuilt when apps come and go or icons change."""
+        return len(internal_os.apps.registered_apps), internal_os.apps.icons.rebuilds
 
     def get_apps_to_show(self):
         apps = list(filter(lambda app: app.app_path != "/apps/home-screen", internal_os.apps.registered_apps))
@@ -103,21 +124,15 @@ class App(badge.BaseApp):
         else:
             return other_apps
 
-    def draw_app_icon(self, app_repr, x, y, selected, index):
-        fb = None
-        if index < len(self.cached_icons):
-            fb = self.cached_icons[index]
-        else:
-            if app_repr.logo_path is None:
-                fb = self.missing_icon
-            else:
-                fb = badge.display.import_pbm(app_repr.logo_path)
-            self.cached_icons.append(fb)
-        badge.display.blit(fb, x+9, y)
-        if selected:
-            badge.display.rect(x+6, y-3, 54, 54, 0)
-        for i, frag in enumerate([app_repr.display_name[j:j+7] for j in range(0, len(app_repr.display_name), 7)]):
-            badge.display.text(frag, x+5, y+50+i*9, 0)
+    def get_app_icon(self, app_repr):
+        # the OS keeps every registered app's icon in an atlas, built when the apps are scanned
+        fb = internal_os.apps.icons.get(app_repr.app_path)
+        if fb is None:
+            # the app was registered since the last scan finished
+            if self.missing_icon is None:
+                self.missing_icon = badge.display.import_pbm("/missingtex.pbm")
+            fb = self.missing_icon
+        return fb
 
     def launch_app(self, app_repr) -> None:
         """
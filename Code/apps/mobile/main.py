@@ -116,7 +116,9 @@ class App(badge.BaseApp):
         timestamp = int(time.time())
         full_msg = struct.pack(MSG_FMT, 0, b'\x00' * 32, b'\x00' * 32, timestamp, len(message), message_bytes)
 
-        internal_os.radio._send_msg(b'\xff\xff', b'\x00\x0B', full_msg)
+        # queued as OS traffic, with the airtime budget and listen-before-talk like any packet
+        if not internal_os.radio.send_announcement(full_msg):
+            self.logger.warning("Transmit queue full, message not sent")
 
     def get_last_displayed_message_timestamp(self) -> int:
         try:
@@ -186,12 +188,7 @@ class App(badge.BaseApp):
             self.received_message = None
 
     def wrap_message(self, message: str, size: int) -> list[str]:
-        max_chars_per_line = 16 if size == 24 else 25
-        wrapped_message = [message[i:i + max_chars_per_line] for i in range(0, len(message), max_chars_per_line)]
-        result = []
-        for line in wrapped_message:
-            result += line.split('\n')  # Split by newlines if any
-        return result
+        return badge.layout.wrap(message, size, badge.display.width)
 
     def num_to_weekday(self, num: int) -> str:
         """
@@ -295,7 +292,7 @@ class App(badge.BaseApp):
             import asyncio
             internal_os = InternalOS.instance()
             internal_os.display.fill(1)
-            internal_os.display.display.display_base_image()
+            internal_os.display.present(full=True)
             asyncio.create_task(internal_os.apps.launch_app(internal_os.apps.get_current_app_repr()))
         else:
             self.logger.info(f"Received packet in foreground app")
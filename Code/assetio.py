@@ -0,0 +1,90 @@
+# Scratch memory for reading assets without allocating.
+#
+# stream.read(n) allocates a new bytes object on every call, and on the
+# RP2040's small heap a steady trickle of short-lived buffers (font index
+# reads, PBM pixel data that's drawn once and dropped...) fragments it and
+# triggers collections. Instead, each thread gets a fixed arena allocated
+# once at boot; readers borrow memoryview slices of it with a bump pointer
+# and give them back by restoring a mark, stack style:
+#
+#     arena = assetio.scratch()
+#     mark = arena.mark()
+#     try:
+#         data = arena.read(stream, n)
+#         ... use data, never keep a reference to it ...
+#     finally:
+#         arena.release(mark)
+#
+# Borrows that don't fit fall back to a plain allocation, so running out of
+# scratch space is only slower, never an error. Every thread has its own
+# arena (the OS on core 0 and the app on core 1 both read assets), so no
+# locking is needed.
+
+import _thread
+
+SCRATCH_SIZE = const(1024)
+
+class Arena:
+    def __init__(self, size):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.top = 0
+        self.high_water = 0 # Most bytes ever borrowed at once.
+        self.misses = 0 # Borrows that didn't fit and were allocated instead.
+
+    # Borrow n bytes, valid until release() is called with a mark taken
+    # before this call.
+    def borrow(self, n):
+        top = self.top
+        if top + n > len(self.buf):
+            self.misses += 1
+            return memoryview(bytearray(n))
+        self.top = top + n
+        if self.top > self.high_water:
+            self.high_water = self.top
+        return self.view[top:top+n]
+
+    def mark(self):
+        return self.top
+
+    def release(self, mark):
+        self.top = mark
+
+    # Read up to n bytes from a stream into borrowed memory, and return a
+    # view of what was actually read.
+    def read(self, stream, n):
+        view = self.borrow(n)
+        got = stream.readinto(view) or 0
+        return view if got == n else view[:got]
+
+    def stats(self):
+        return {
+            "size": len(self.buf),
+            "in_use": self.top,
+            "high_water": self.high_water,
+            "misses": self.misses,
+        }
+
+_arenas = {}
+
+# Return the calling thread's arena, allocating it on first use. The OS
+# calls this at boot for its own thread and for the app thread, so that the
+# arenas are allocated before the heap gets fragmented.
+def scratch():
+    ident = _thread.get_ident()
+    arena = _arenas.get(ident)
+    if arena is None:
+        arena = Arena(SCRATCH_SIZE)
+        _arenas[ident] = arena
+    return arena
+
+# Return a buffer of at least n bytes for a loader: a new bytearray if buf is
+# None, n bytes borrowed from buf if it's an Arena, or buf itself otherwise.
+def buffer_for(buf, n):
+    if buf is None:
+        return bytearray(n)
+    if isinstance(buf, Arena):
+        return buf.borrow(n)
+    if len(buf) < n:
+        raise ValueError(f"Buffer too small: {len(buf)} < {n} bytes")
+    return buf
@@ -5,8 +5,10 @@ import badge.buzzer as buzzer
 import badge.contacts as contacts
 import badge.display as display
 import badge.input as input
+import badge.layout as layout
 import badge.notifs as notifs
 import badge.radio as radio
 import badge.time as time
+import badge.ui as ui
 import badge.utils as utils
 import badge.uart as uart
\ No newline at end of file
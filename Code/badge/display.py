@@ -1,11 +1,14 @@
 try:
-    from typing import Union
+    from typing import Union, Optional, Callable, List, Tuple
 except ImportError:
     # we're on an MCU, typing is not available
     pass
 
 import framebuf
-from microfont import MicroFont
+from microfont import MicroFont, glyph_cache
+from internal_os.hardware.drawlist import DrawList
+from internal_os.textcache import TextCache
+import internal_os.assets as assets
 import _thread
 
 from internal_os.internalos import InternalOS
@@ -15,6 +18,14 @@ internal_os = InternalOS.instance()
 width = 200
 height = 200
 
+def size() -> Tuple[int, int]:
+    """
+    Get the (width, height) your app can draw in.
+    Apps get the whole display (width x height), unless they set "fullScreen": false in their manifest: then they get
+    the area under the status bar, and their coordinates start at the top-left corner of that area.
+    """
+    return internal_os.display.target_width, internal_os.display.target_height
+
 def _is_display_allowed() -> bool:
     """
     Check if the display is allowed to be used.
@@ -30,25 +41,90 @@ def sleep():
         raise RuntimeError("Cannot call display functions from a backgrounded app context.")
     internal_os.display.sleep_disp()
 
-def show(force_full_refresh: bool = False) -> None:
+def show(force_full_refresh: bool = False, regions: Optional[List[Tuple[int, int, int, int]]] = None) -> int:
     """
-    Push the contents of the internal framebuffer to the display.
+    Present the contents of the internal framebuffer to the display.
     NOTE: YOUR DRAWING WILL NOT DO ANYTHING UNTIL YOU CALL THIS FUNCTION!
-    On CFW, this will only refresh the display every 8 times it is called, or if explicitly requested with the force_full_refresh parameter.
+    On CFW, partial refreshes are used unless the force_full_refresh parameter is set, and a full refresh is done automatically
+    once enough pixels have flipped since the last one for ghosting to become visible (or after a few minutes of ghosting).
     OFW will always refresh the display, so if your app targets CFW, please try managing your display updates to avoid ghosting.
+    Partial refreshes only send the regions that changed since the last frame, so redrawing a small part of the screen is cheap.
+    The frame is copied and flushed in the background, so this returns straight away and you can keep drawing.
+    If you call this faster than the panel can refresh, frames in between are dropped and the latest one is shown.
+    :param force_full_refresh: Use a full refresh instead of a partial one.
+    :param regions: If you know which (x, y, w, h) regions you changed since the last show(), pass them to skip copying
+                    and comparing the rest of the screen. Changes outside of them may not be displayed.
+                    If your app is windowed, only these regions of its surface are copied to the display.
+    :return: The sequence number of the presented frame.
+    """
+    if not _is_display_allowed():
+        raise RuntimeError("Cannot call display functions from a backgrounded app context.")
+    return internal_os.display.present(full=force_full_refresh, regions=regions)
+
+def set_frame_rate(fps: float) -> None:
+    """
+    Limit how often the panel is refreshed while your app is running.
+    Frames you show() faster than this are merged, and only the newest one is displayed.
+    Use this to let your game logic run at its own rate without the panel trying to keep up with every frame.
+    :param fps: Maximum refreshes per second, or 0 (the default) to refresh as fast as the panel allows.
+    """
+    if not _is_display_allowed():
+        raise RuntimeError("Cannot call display functions from a backgrounded app context.")
+    internal_os.display.set_frame_rate(fps)
+
+def displayed_frame() -> int:
+    """
+    Get the sequence number (as returned by show()) of the newest frame that actually reached the panel.
+    """
+    return internal_os.display.displayed_seq
+
+def on_frame_displayed(callback: Optional[Callable[[int], None]]) -> None:
+    """
+    Register a function to be told when frames reach the panel.
+    It is called from show() (on your app's thread) with the sequence number of the newest displayed frame,
+    whenever that changed since the last call. Frames that were merged into a newer one are never reported.
+    :param callback: Function taking the frame's sequence number, or None to remove it.
     """
     if not _is_display_allowed():
         raise RuntimeError("Cannot call display functions from a backgrounded app context.")
+    internal_os.display.on_presented = callback
 
+def flush(force_full_refresh: bool = False) -> bool:
+    """
+    Send the internal framebuffer to the display directly instead of handing it to the background flush.
+    Returns as soon as the frame has been sent, while the panel is still refreshing.
+    You can start drawing the next frame straight away; the next flush() waits for the refresh if needed.
+    :param force_full_refresh: Use a full refresh instead of a partial one.
+    :return: Whether a refresh was started (False if nothing changed since the last frame).
+    """
+    if not _is_display_allowed():
+        raise RuntimeError("Cannot call display functions from a backgrounded app context.")
+    return internal_os.display.flush(full=force_full_refresh)
 
-    internal_os.display_refresh_count += 1
-    print(f"Display refresh count: {internal_os.display_refresh_count}")
-    # every 8 calls, or if explicitly requested, do a full refresh
-    # todo: maybe calculate the delta of changed pixels and only full refresh if the delta is above a certain threshold?
-    if internal_os.display_refresh_count % 8 == 0:
-        internal_os.display.show(full=True)
-    else:
-        internal_os.display.show(full=force_full_refresh)
+async def show_async(force_full_refresh: bool = False) -> None:
+    """
+    Send the internal framebuffer to the display directly, yielding to other tasks while the panel refreshes.
+    Only usable from coroutines running on the OS thread.
+    :param force_full_refresh: Use a full refresh instead of a partial one.
+    """
+    if not _is_display_allowed():
+        raise RuntimeError("Cannot call display functions from a backgrounded app context.")
+    await internal_os.display.show_async(full=force_full_refresh)
+
+def get_stats() -> dict:
+    """
+    Get counters describing the display's performance, e.g. for tuning how often your app refreshes.
+    "timings" maps each phase of a refresh (init, mode, transfer, refresh) to (total microseconds, count).
+    "frames_presented", "frames_flushed" and "frames_dropped" count the frames passed to show() and what became of them.
+    "refreshes" counts full and partial refreshes, and the full refreshes avoided compared to refreshing fully every 8 frames.
+    "glyph_cache" has the hit, miss and eviction counters of the nice_text glyph cache, and how much of its byte budget is used.
+    "text_cache" has the same for the cache of rendered strings, once nice_text(..., cache=True) was used.
+    """
+    stats = internal_os.display.get_stats()
+    stats["glyph_cache"] = glyph_cache.stats()
+    if _text_cache is not None:
+        stats["text_cache"] = _text_cache.cache.stats()
+    return stats
 
 def fill(color: int) -> None:
     """
@@ -145,24 +221,68 @@ def text(text: str, x: int, y: int, color: int = 0) -> None:
         raise RuntimeError("Cannot call display functions from a backgrounded app context.")
     internal_os.display.text(text, x, y, color)
 
-import gc
-print(f"Mem before fonts: {gc.mem_free()}")
-
-nice_fonts = {
-    12: MicroFont("fonts/victor_B_12.mfnt"),
-    15: MicroFont("fonts/victor_R_15.mfnt"),
-    18: MicroFont("fonts/victor_B_18.mfnt"),
-    24: MicroFont("fonts/victor_B_24.mfnt"),
-    32: MicroFont("fonts/victor_B_32.mfnt"),
-    42: MicroFont("fonts/victor_B_42.mfnt"),
-    54: MicroFont("fonts/victor_B_54.mfnt"),
-    68: MicroFont("fonts/victor_B_68.mfnt"),
-    70: MicroFont("fonts/victor_B_70.mfnt"),
+# Header fields of the included fonts: size -> (file, height, baseline, max_width, monospaced, index_len).
+# This lets the metrics be used without opening the files; regenerate it if a font file changes.
+_FONT_TABLE = {
+    12: ("fonts/victor_B_12.mfnt", 12, 10, 6, 0, 460),
+    15: ("fonts/victor_R_15.mfnt", 15, 13, 8, 0, 460),
+    18: ("fonts/victor_B_18.mfnt", 18, 15, 9, 0, 460),
+    24: ("fonts/victor_B_24.mfnt", 26, 22, 12, 0, 460),
+    32: ("fonts/victor_B_32.mfnt", 32, 27, 15, 0, 460),
+    42: ("fonts/victor_B_42.mfnt", 42, 36, 20, 0, 460),
+    54: ("fonts/victor_B_54.mfnt", 55, 46, 27, 0, 460),
+    68: ("fonts/victor_B_68.mfnt", 69, 58, 33, 0, 460),
+    70: ("fonts/victor_B_70.mfnt", 70, 59, 34, 0, 460),
 }
 
-print(f"Mem after fonts: {gc.mem_free()}")
+class FontRegistry:
+    """
+    The included fonts, by size. Works like a read-only dict of size -> MicroFont.
+    A MicroFont is only created when its size is first looked up, and its file is only opened when a glyph is first drawn;
+    at most a few font files are open at once (see microfont.file_pool), the least recently used one gets closed.
+    """
+    def __init__(self, table: dict) -> None:
+        self._table = table
+        self._fonts = {}
+
+    def __getitem__(self, size: int) -> MicroFont:
+        font = self._fonts.get(size)
+        if font is None:
+            filename, *header = self._table[size]
+            font = MicroFont(filename, header=header)
+            self._fonts[size] = font
+        return font
+
+    def get(self, size: int, default=None) -> Optional[MicroFont]:
+        return self[size] if size in self._table else default
+
+    def __contains__(self, size: int) -> bool:
+        return size in self._table
+
+    def __iter__(self):
+        return iter(self._table)
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def keys(self):
+        return self._table.keys()
+
+    def items(self):
+        return [(size, self[size]) for size in self._table]
 
-def nice_text(text: str, x: int, y: int, font: Union[int, MicroFont] = 18, color: int = 0, *, rot: int = 0, x_spacing: int = 0, y_spacing: int = 0) -> None:
+nice_fonts = FontRegistry(_FONT_TABLE)
+
+_text_cache = None
+
+def _get_text_cache() -> TextCache:
+    global _text_cache
+    if _text_cache is None:
+        _text_cache = TextCache()
+        _text_cache.load()
+    return _text_cache
+
+def nice_text(text: str, x: int, y: int, font: Union[int, MicroFont] = 18, color: int = 0, *, rot: int = 0, x_spacing: int = 0, y_spacing: int = 0, cache: bool = False) -> None:
     """
     Draw text using a nice font.
     Included fonts are Victor Mono Bold in 12, 18, 24, 32, 42, 54, 68, and 70pt sizes, and Victor Mono Regular in 15pt size.
@@ -176,6 +296,9 @@ def nice_text(text: str, x: int, y: int, font: Union[int, MicroFont] = 18, color
     :param rot: Rotation angle in degrees.
     :param x_spacing: Horizontal spacing between characters.
     :param y_spacing: Vertical spacing between lines.
+    :param cache: Keep the rendered text around, so drawing the same string again is a single blit. Use it for text you draw
+                  over and over (labels, names...), not for text that keeps changing. Rotated text is never cached.
+                  See save_text_cache() to keep the rendered text across reboots.
     """
     if not _is_display_allowed():
         raise RuntimeError("Cannot call display functions from a backgrounded app context.")
@@ -185,10 +308,21 @@ def nice_text(text: str, x: int, y: int, font: Union[int, MicroFont] = 18, color
     if not font:
         raise ValueError(f"Invalid font size. Available built-in sizes: {', '.join(map(str, nice_fonts.keys()))}, or provide a MicroFont instance with your own font.")
 
-    font.write(text, internal_os.display.display.framebuf, framebuf.MONO_HLSB, width, height, x, y, color, rot=rot, x_spacing=x_spacing, y_spacing=y_spacing)
+    if cache and rot == 0:
+        _get_text_cache().draw(internal_os.display.target, font, text, x, y, color, x_spacing, y_spacing)
+        return
+    display = internal_os.display
+    font.write(text, display.target, framebuf.MONO_HLSB, display.target_width, display.target_height, x, y, color, rot=rot, x_spacing=x_spacing, y_spacing=y_spacing)
 
 
 
+def save_text_cache() -> None:
+    """
+    Save the text rendered with nice_text(..., cache=True) to flash, so that it doesn't have to be rendered again after a reboot.
+    Only writes to flash if something new was rendered since the last save.
+    """
+    _get_text_cache().save()
+
 def blit(fb: framebuf.FrameBuffer, x: int, y: int) -> None:
     """
     Blit a FrameBuffer onto the display.
@@ -200,28 +334,34 @@ def blit(fb: framebuf.FrameBuffer, x: int, y: int) -> None:
         raise RuntimeError("Cannot call display functions from a backgrounded app context.")
     internal_os.display.blit(fb, x, y)
 
+def draw(dl: DrawList) -> None:
+    """
+    Run a batch of drawing commands in one call.
+    Much faster than calling the drawing functions one by one when drawing lots of primitives,
+    since the app check is only done once and pixels, lines along the axes and rectangles are drawn natively.
+    Usage: ```python
+    dl = badge.display.DrawList()
+    dl.fill_rect(0, 0, 12, 12, 0)
+    dl.nice_text("Hi", 20, 0, font=24)
+    badge.display.draw(dl)
+    dl.clear()  # reuse it for the next frame
+    ```
+    :param dl: The DrawList to run. It is not cleared.
+    """
+    if not _is_display_allowed():
+        raise RuntimeError("Cannot call display functions from a backgrounded app context.")
+    internal_os.display.draw(dl, nice_fonts)
+
 def import_pbm(file_path: str) -> framebuf.FrameBuffer:
     """
     Import a PBM image file (type P4) and return it as a FrameBuffer.
+    Images that ship with the firmware are loaded from the prebuilt asset bundle, without parsing the PBM.
     :param file_path: Path to the PBM file.
     :return: FrameBuffer object containing the image.
     this converter is known to work: https://convertio.co/png-pbm/
     """
     try:
-        with open(file_path, 'rb') as f:
-            # Read the header
-            header = f.readline().strip()
-            if header != b'P4':
-                raise ValueError("File is not a valid binary PBM file.")
-            # Read the width and height
-            dimensions = f.readline().strip()
-            width, height = map(int, dimensions.split())
-            # Read the pixel data
-            pixel_data = bytearray(~b & 0xFF for b in f.read()) # the e-ink means the PBM format swaps black and white
-            if len(pixel_data) != (width * height + 7) // 8:
-                raise ValueError("Pixel data does not match specified dimensions.")
-            # Create a FrameBuffer from the pixel data
-            fb = framebuf.FrameBuffer(pixel_data, width, height, framebuf.MONO_HLSB)
+        fb = assets.load_pbm(file_path)
     except Exception as e:
         if file_path == "/missingtex.pbm":
             print("everything's all fucked up!!")
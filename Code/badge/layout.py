@@ -0,0 +1,135 @@
+"""
+Text layout for nice_text fonts: word wrapping, hyphenation and picking the biggest font that fits a box.
+Everything is measured from the fonts' glyph widths, without drawing, so the layout is computed once and then drawn
+with a single nice_text call.
+Usage: ```python
+block = badge.layout.fit("Ada Lovelace", 200, 100, sizes=[54, 42, 32, 24])
+block.draw(0, 0)
+```
+"""
+try:
+    from typing import List, Optional, Tuple, Union
+except ImportError:
+    # we're on an MCU, typing is not available
+    pass
+
+from microfont import MicroFont
+import badge.display as display
+
+class TextBlock:
+    """Wrapped text in a font, ready to be drawn."""
+    def __init__(self, font: MicroFont, lines: List[str], hyphenated: bool = False) -> None:
+        """
+        :param font: The font the text was laid out for.
+        :param lines: The lines of text.
+        :param hyphenated: Whether words had to be broken across lines, or lines had to be dropped.
+        """
+        self.font = font
+        self.lines = lines
+        self.hyphenated = hyphenated
+        self.text = "\n".join(lines)
+        self.width, self.height = font.measure(self.text)
+
+    def draw(self, x: int, y: int, color: int = 0, cache: bool = False) -> None:
+        """
+        Draw the text with its top-left corner at (x, y).
+        :param x: X coordinate of the text.
+        :param y: Y coordinate of the text.
+        :param color: Color of the text (0=black, 1=white).
+        :param cache: See badge.display.nice_text.
+        """
+        display.nice_text(self.text, x, y, font=self.font, color=color, cache=cache)
+
+def _get_font(font: Union[int, MicroFont]) -> MicroFont:
+    if isinstance(font, int):
+        return display.nice_fonts[font]
+    return font
+
+def _break_word(word: str, font: MicroFont, width: int, hyphenate: bool) -> List[str]:
+    """Split a word that is wider than the line into pieces that fit, ending each but the last with a hyphen."""
+    pieces = []
+    hyphen = font.advance("-") if hyphenate else 0
+    piece = ""
+    piece_width = 0
+    for i, c in enumerate(word):
+        c_width = font.advance(c)
+        # the hyphen is only needed if there are characters left after this piece
+        if piece and piece_width + c_width + (hyphen if i < len(word) - 1 else 0) > width:
+            pieces.append(piece + "-" if hyphenate else piece)
+            piece = ""
+            piece_width = 0
+        piece += c
+        piece_width += c_width
+    pieces.append(piece)
+    return pieces
+
+def wrap(text: str, font: Union[int, MicroFont], width: int = display.width, hyphenate: bool = True) -> List[str]:
+    """
+    Greedily wrap text into lines no wider than width, breaking at spaces. Existing newlines are kept.
+    Words wider than a whole line are broken across lines.
+    :param text: The text to wrap.
+    :param font: Font size or MicroFont (see badge.display.nice_text).
+    :param width: Maximum width of a line in pixels.
+    :param hyphenate: Whether to end the pieces of broken words with a hyphen. Turn it off for things like handles or URLs.
+    :return: The lines of text.
+    """
+    return _wrap(text, _get_font(font), width, hyphenate)[0]
+
+def _wrap(text: str, font: MicroFont, width: int, hyphenate: bool) -> Tuple[List[str], bool]:
+    """wrap(), also returning whether any word had to be broken."""
+    broken = False
+    space = font.advance(" ")
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        line_width = 0
+        for word in paragraph.split(" "):
+            word_width = font.measure(word)[0]
+            if line and line_width + space + word_width <= width:
+                line += " " + word
+                line_width += space + word_width
+                continue
+            if line:
+                lines.append(line)
+            if word_width <= width:
+                line = word
+                line_width = word_width
+                continue
+            pieces = _break_word(word, font, width, hyphenate)
+            broken = True
+            lines += pieces[:-1]
+            line = pieces[-1]
+            line_width = font.measure(line)[0]
+        lines.append(line)
+    return lines, broken
+
+def fit(text: str, width: int, height: int, sizes: Optional[List[int]] = None, hyphenate: bool = True) -> TextBlock:
+    """
+    Lay out text in the biggest font that fits in a width x height box.
+    Fonts that fit without breaking words are preferred over bigger fonts that would need to break them.
+    If nothing fits, the smallest font is used and the lines that don't fit are dropped.
+    :param text: The text to lay out.
+    :param width: Width of the box in pixels.
+    :param height: Height of the box in pixels.
+    :param sizes: Font sizes to choose from (see badge.display.nice_fonts). Defaults to all of them.
+    :param hyphenate: See wrap().
+    :return: The laid out text.
+    """
+    if sizes is None:
+        sizes = list(display.nice_fonts.keys())
+    sizes = sorted(sizes, reverse=True)
+    fallback = None
+    for size in sizes:
+        font = display.nice_fonts[size]
+        lines, broken = _wrap(text, font, width, hyphenate)
+        if len(lines) * font.height > height:
+            continue
+        if not broken:
+            return TextBlock(font, lines)
+        if fallback is None:
+            fallback = TextBlock(font, lines, hyphenated=True)
+    if fallback is not None:
+        return fallback
+    font = display.nice_fonts[sizes[-1]]
+    lines = _wrap(text, font, width, hyphenate)[0]
+    return TextBlock(font, lines[:max(height // font.height, 1)], hyphenated=True)
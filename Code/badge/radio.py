@@ -2,19 +2,68 @@ from internal_os.internalos import BadgeRadio
 from internal_os.internalos import InternalOS
 from internal_os.hardware.radio import Packet
 
+try:
+    from typing import Callable, Optional
+except ImportError:
+    # we're on an MCU, typing is not available
+    pass
+
 internal_os = InternalOS.instance()
 
-def send_packet(dest: int, data: bytes) -> None:
+def _current_app_number() -> int:
+    selected_app = internal_os.apps.get_current_app_repr()
+    if selected_app is None:
+        raise AttributeError("no app is currently selected; cannot retrieve app_number.")
+    return selected_app.app_number
+
+def send_packet(dest: int, data: bytes, on_sent: Optional[Callable[[Packet, bool], None]] = None) -> bool:
     """
     Sends a packet over the radio.
-    Send a packet. To avoid flooding the radio bandwidth, this method can only send packets at a rate of 1 every 1.5 seconds. Any additional packets are added to a queue.
+    To avoid flooding the radio bandwidth, the badge only transmits a limited share of the time (see
+    get_airtime_budget()), so the packet is added to a queue. Small packets use less of the budget than big ones.
+    Each app can have several packets in the queue, and apps with packets waiting take turns.
+    :param dest: Address of the destination badge, or 0xFFFF to broadcast.
+    :param data: Payload of the packet.
+    :param on_sent: Called with (packet, sent) once the packet was sent. It runs on the app's thread, between two
+                    loop() calls.
+    :return: True if the packet was queued, False if the app's queue is full; wait and try again (see can_send()).
+    :raises ValueError: If data is longer than 249 bytes.
+    """
+    return internal_os.radio.add_to_tx_queue(dest, _current_app_number(), data, on_sent=on_sent)
 
+def can_send() -> bool:
     """
+    Checks whether send_packet() would queue a packet right now.
+    """
+    return internal_os.radio.can_send(_current_app_number())
 
-    selected_app = internal_os.apps.get_current_app_repr()
-    if selected_app is None:
-        raise AttributeError("no app is currently selected; cannot retrieve app_number.")
-    app_number = selected_app.app_number
-    if any([p.app_number == app_number for p in internal_os.radio._transmit_queue]):
-        raise RuntimeError(f"App {selected_app.display_name} already has a packet in the transmit queue. Please wait until it is sent before sending another packet. (See get_send_queue_size())")
-    internal_os.radio.add_to_tx_queue(dest, app_number, data)
+def get_send_queue_size() -> int:
+    """
+    Gets the number of packets of the current app waiting to be sent.
+    """
+    return internal_os.radio.get_send_queue_size(_current_app_number())
+
+def get_queue_stats() -> dict:
+    """
+    Gets the length and counters of the radio's receive and transmit queues.
+    :return: {"rx": {...}, "tx": {"system": {...}, "apps": {app_number: {...}}}}, each queue with "capacity",
+             "length", "enqueued", "dropped" and "high_water".
+    """
+    return internal_os.radio.get_queue_stats()
+
+def get_airtime_budget() -> float:
+    """
+    Gets the airtime the badge can spend transmitting right now, shared by all apps.
+    The budget refills over time at the radio's duty cycle, and every packet sent spends its time on air.
+    :return: Remaining airtime, in milliseconds.
+    """
+    return internal_os.radio.get_airtime_budget() / 1000
+
+def get_time_to_next_send(size: int = 249) -> float:
+    """
+    Gets the time until the airtime budget allows sending a packet, ignoring any packets already queued.
+    :param size: Size of the packet's data, in bytes. Defaults to the largest packet.
+    :return: Time to wait, in seconds. 0 if it could be sent right away.
+    :raises ValueError: If size is longer than 249 bytes.
+    """
+    return internal_os.radio.get_time_to_next_send(size)
@@ -0,0 +1,288 @@
+"""
+Retained-mode widgets for e-ink UIs.
+Build your screen out of widgets once, change them through their setters, and call Screen.render().
+Only the widgets that changed are redrawn, and only their regions are handed to the display, so moving
+a cursor between two items touches those two items instead of the whole screen.
+Usage: ```python
+screen = badge.ui.Screen()
+title = screen.add(badge.ui.Label(0, 0, 200, "Hello", font=24))
+screen.render()
+title.set_text("Hello again")
+screen.render()  # only redraws the title
+```
+"""
+try:
+    from typing import List, Optional, Tuple, Union
+except ImportError:
+    # we're on an MCU, typing is not available
+    pass
+
+import framebuf
+from microfont import MicroFont
+import badge.display as display
+
+class Widget:
+    """
+    Something drawn in a rectangle of the screen.
+    Subclasses implement draw(), and call invalidate() whenever something they draw changes.
+    """
+    def __init__(self, x: int, y: int, w: int, h: int) -> None:
+        """
+        :param x: X coordinate of the top-left corner.
+        :param y: Y coordinate of the top-left corner.
+        :param w: Width of the widget.
+        :param h: Height of the widget.
+        """
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.dirty = True
+
+    def bounds(self) -> Tuple[int, int, int, int]:
+        """Get the (x, y, w, h) rectangle the widget draws in."""
+        return (self.x, self.y, self.w, self.h)
+
+    def invalidate(self) -> None:
+        """Mark the widget as needing to be redrawn on the next render."""
+        self.dirty = True
+
+    def draw(self) -> None:
+        """Draw the widget. Its rectangle has already been cleared to white."""
+        raise NotImplementedError("Widget subclasses must implement 'draw'.")
+
+    def render(self, regions: List[Tuple[int, int, int, int]]) -> None:
+        """
+        Redraw the widget if it's dirty.
+        :param regions: List the redrawn rectangles are appended to.
+        """
+        if not self.dirty:
+            return
+        display.fill_rect(self.x, self.y, self.w, self.h, 1)
+        self.draw()
+        self.dirty = False
+        regions.append(self.bounds())
+
+class Label(Widget):
+    """A line (or a few lines) of text."""
+    def __init__(self, x: int, y: int, w: int, text: str = "", font: Union[int, MicroFont, None] = 18, color: int = 0, lines: int = 1) -> None:
+        """
+        :param x: X coordinate of the top-left corner.
+        :param y: Y coordinate of the top-left corner.
+        :param w: Width of the label.
+        :param text: Text to show.
+        :param font: Font size or MicroFont (see badge.display.nice_text), or None for the 8x8 font.
+        :param color: Color of the text (0=black, 1=white).
+        :param lines: Number of lines of text the label has room for.
+        """
+        if isinstance(font, int):
+            font = display.nice_fonts[font]
+        line_height = font.height if font is not None else 9
+        super().__init__(x, y, w, line_height * lines)
+        self.text = text
+        self.font = font
+        self.color = color
+        self.line_height = line_height
+
+    def set_text(self, text: str) -> None:
+        """Change the text, redrawing the label only if it's different."""
+        if text != self.text:
+            self.text = text
+            self.invalidate()
+
+    def draw(self) -> None:
+        if self.font is None:
+            for i, line in enumerate(self.text.split("\n")):
+                display.text(line, self.x, self.y + i * self.line_height, self.color)
+        else:
+            display.nice_text(self.text, self.x, self.y, font=self.font, color=self.color)
+
+class Icon(Widget):
+    """An image with an optional caption under it, and an outline when selected."""
+    def __init__(self, x: int, y: int, w: int, h: int, fb: framebuf.FrameBuffer, icon_w: int, icon_h: int, caption: str = "", selected: bool = False) -> None:
+        """
+        :param x: X coordinate of the top-left corner.
+        :param y: Y coordinate of the top-left corner.
+        :param w: Width of the widget (the icon is centered in it).
+        :param h: Height of the widget, including the caption.
+        :param fb: The image (e.g. from badge.display.import_pbm).
+        :param icon_w: Width of the image.
+        :param icon_h: Height of the image.
+        :param caption: Text shown under the image in the 8x8 font, wrapped to the widget's width.
+        :param selected: Whether to draw an outline around the image.
+        """
+        super().__init__(x, y, w, h)
+        self.fb = fb
+        self.icon_w = icon_w
+        self.icon_h = icon_h
+        self.caption = caption
+        self.selected = selected
+
+    def set_selected(self, selected: bool) -> None:
+        """Show or hide the outline."""
+        if selected != self.selected:
+            self.selected = selected
+            self.invalidate()
+
+    def set_image(self, fb: framebuf.FrameBuffer) -> None:
+        """Change the image."""
+        self.fb = fb
+        self.invalidate()
+
+    def draw(self) -> None:
+        icon_x = self.x + (self.w - self.icon_w) // 2
+        icon_y = self.y + 3  # leave room for the outline
+        display.blit(self.fb, icon_x, icon_y)
+        if self.selected:
+            display.rect(icon_x - 3, icon_y - 3, self.icon_w + 6, self.icon_h + 6, 0)
+        chars = max((self.w - 2) // 8, 1)
+        text_x = self.x + (self.w - min(len(self.caption), chars) * 8) // 2
+        text_y = icon_y + self.icon_h + 2
+        for i in range(0, len(self.caption), chars):
+            if text_y + 8 > self.y + self.h:
+                break
+            display.text(self.caption[i:i + chars], text_x, text_y, 0)
+            text_y += 9
+
+class ListView(Widget):
+    """A vertical list of text rows, one of which can be highlighted."""
+    def __init__(self, x: int, y: int, w: int, h: int, items: Optional[List[str]] = None, font: Union[int, MicroFont, None] = 18, selected: int = -1) -> None:
+        """
+        :param x: X coordinate of the top-left corner.
+        :param y: Y coordinate of the top-left corner.
+        :param w: Width of the list.
+        :param h: Height of the list. Rows that don't fit are scrolled to when selected.
+        :param items: Text of each row.
+        :param font: Font size or MicroFont (see badge.display.nice_text), or None for the 8x8 font.
+        :param selected: Index of the highlighted row, or -1 for none.
+        """
+        super().__init__(x, y, w, h)
+        if isinstance(font, int):
+            font = display.nice_fonts[font]
+        self.font = font
+        self.row_height = font.height if font is not None else 9
+        self.visible_rows = max(h // self.row_height, 1)
+        self.items = items if items is not None else []
+        self.selected = selected
+        self.top = 0
+        self._dirty_rows = set()
+
+    def set_items(self, items: List[str]) -> None:
+        """Replace all the rows."""
+        self.items = items
+        self.top = 0
+        self.invalidate()
+
+    def set_selected(self, index: int) -> None:
+        """Highlight another row, redrawing only the two rows involved unless the list has to scroll."""
+        if index == self.selected:
+            return
+        old = self.selected
+        self.selected = index
+        if index >= 0 and not (self.top <= index < self.top + self.visible_rows):
+            self.top = max(0, index - self.visible_rows + 1) if index >= self.top else index
+            self.invalidate()
+            return
+        self._dirty_rows.add(old)
+        self._dirty_rows.add(index)
+
+    def _row_bounds(self, index: int) -> Tuple[int, int, int, int]:
+        return (self.x, self.y + (index - self.top) * self.row_height, self.w, self.row_height)
+
+    def _draw_row(self, index: int) -> None:
+        x, y, w, h = self._row_bounds(index)
+        selected = index == self.selected
+        if selected:
+            display.fill_rect(x, y, w, h, 0)
+        color = 1 if selected else 0
+        if self.font is None:
+            display.text(self.items[index], x + 2, y, color)
+        else:
+            display.nice_text(self.items[index], x + 2, y, font=self.font, color=color)
+
+    def draw(self) -> None:
+        for index in range(self.top, min(self.top + self.visible_rows, len(self.items))):
+            self._draw_row(index)
+
+    def render(self, regions: List[Tuple[int, int, int, int]]) -> None:
+        if self.dirty:
+            self._dirty_rows.clear()
+            super().render(regions)
+            return
+        for index in self._dirty_rows:
+            if self.top <= index < min(self.top + self.visible_rows, len(self.items)):
+                bounds = self._row_bounds(index)
+                display.fill_rect(bounds[0], bounds[1], bounds[2], bounds[3], 1)
+                self._draw_row(index)
+                regions.append(bounds)
+        self._dirty_rows.clear()
+
+class Container(Widget):
+    """A widget made of other widgets. Only the children that changed are redrawn."""
+    def __init__(self, x: int, y: int, w: int, h: int) -> None:
+        super().__init__(x, y, w, h)
+        self.children = []
+
+    def add(self, child: Widget) -> Widget:
+        """Add a child widget, and return it."""
+        self.children.append(child)
+        self.invalidate()
+        return child
+
+    def clear(self) -> None:
+        """Remove all the children."""
+        self.children = []
+        self.invalidate()
+
+    def draw(self) -> None:
+        ignored = []
+        for child in self.children:
+            child.invalidate()
+            child.render(ignored)
+
+    def render(self, regions: List[Tuple[int, int, int, int]]) -> None:
+        if self.dirty:
+            super().render(regions)
+            return
+        for child in self.children:
+            child.render(regions)
+
+class Grid(Container):
+    """A container that lays its children out in rows of equal cells."""
+    def __init__(self, x: int, y: int, cols: int, cell_w: int, cell_h: int, rows: int = 1) -> None:
+        """
+        :param x: X coordinate of the top-left corner.
+        :param y: Y coordinate of the top-left corner.
+        :param cols: Number of cells per row.
+        :param cell_w: Width of each cell.
+        :param cell_h: Height of each cell.
+        :param rows: Number of rows.
+        """
+        super().__init__(x, y, cols * cell_w, rows * cell_h)
+        self.cols = cols
+        self.cell_w = cell_w
+        self.cell_h = cell_h
+
+    def add(self, child: Widget) -> Widget:
+        """Add a child widget in the next cell, moving and resizing it to fit the cell, and return it."""
+        index = len(self.children)
+        child.x = self.x + (index % self.cols) * self.cell_w
+        child.y = self.y + (index // self.cols) * self.cell_h
+        child.w = self.cell_w
+        child.h = self.cell_h
+        return super().add(child)
+
+class Screen(Container):
+    """The root of a widget tree, covering the whole display."""
+    def __init__(self) -> None:
+        super().__init__(0, 0, *display.size())
+
+    def render(self, force_full_refresh: bool = False) -> None:
+        """
+        Redraw the widgets that changed and show them.
+        :param force_full_refresh: Use a full refresh (see badge.display.show).
+        """
+        regions = []
+        super().render(regions)
+        if regions or force_full_refresh:
+            display.show(force_full_refresh=force_full_refresh, regions=regions or None)
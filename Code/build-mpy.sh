@@ -31,6 +31,10 @@ find . -path ./build -prune -o -type f ! -name "*.py" ! -name "*.mpy" -print | w
     cp "$src" "$dest"
 done
 
+# Pack the PBM images into the asset bundle (see internal_os/assets.py)
+echo "Packing images -> build/assets.bin"
+python3 ../tools/pack_assets.py . -o build/assets.bin > /dev/null
+
 # Clean up the .pyc files (excluding build/)
 find . -path ./build -prune -o -name "*.pyc" -print | while read src; do
     echo "Removing $src"
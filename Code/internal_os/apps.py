@@ -9,7 +9,9 @@ from internal_os.baseapp import BaseApp
 from internal_os.hardware.display import BadgeDisplay
 from internal_os.hardware.buttons import BadgeButtons
 from io import StringIO
-from internal_os.hardware.radio import Packet
+from internal_os.hardware.radio import BadgeRadio, Packet
+from internal_os.iconatlas import IconAtlas
+import assetio
 import logging
 import os
 import json
@@ -43,7 +45,8 @@ class AppRepr:
         app_repr.app_path = path
         app_repr.display_name = json_data.get("displayName", "")
         app_repr.logo_path = path + "/" + json_data.get("logoPath", "")
-        app_repr.full_screen = json_data.get("fullScreen", False)
+        # apps get the whole display unless they opt in to a window under the OS status bar with "fullScreen": false
+        app_repr.full_screen = json_data.get("fullScreen", True)
         app_repr.suppress_notifs = json_data.get("suppressNotifs", False)
         app_repr.permissions = json_data.get("permissions", [])
         app_repr.radio_settings = json_data.get("radioSettings", {})
@@ -116,12 +119,17 @@ def app_thread(app_repr: AppRepr, manager: 'AppManager') -> None:
     # Acquire the lock before running the app
     manager.fg_app_lock.acquire(1) # 1 means block until we get it
     launch_logger.debug(f"Acquired app lock")
+    assetio.scratch()  # allocated on the first launch and kept, since the app thread always has the same ident
     try:
+        # before the app is constructed, since its __init__ may already ask badge.display for its size
+        manager.display.reset_pacing()
+        manager.display.set_window(None if app_repr.full_screen else app_repr.display_name)
         app = load_app(launch_logger, app_repr)
         manager.selected_app_instance = app
         app.on_open()  # pyright: ignore[reportAttributeAccessIssue] # on_open is defined in BaseApp which is confirmed in load_app
         while manager.fg_app_running:
             app.loop() # pyright: ignore[reportAttributeAccessIssue] # loop is defined in BaseApp which is confirmed in load_app
+            manager.radio.report_sent()  # on_sent callbacks run here, on the app thread
         launch_logger.info(f"App {app_repr.display_name} has finished running.")
 
     except Exception as e:
@@ -139,7 +147,8 @@ def app_thread(app_repr: AppRepr, manager: 'AppManager') -> None:
                 for subline in sublines:
                     manager.display.text(subline, 0, 10 + linecount * 10)
                     linecount += 1
-            manager.display.show()
+            # hand the frame to flush_forever, flushing here would race it for the panel
+            manager.display.present(full=True)
         except Exception as display_error:
             launch_logger.exception(display_error, f"Failed to display error on badge: {display_error}")
     finally:
@@ -151,12 +160,13 @@ class AppManager:
     The AppManager class is responsible for managing the apps on the badge.
     It handles app registration, loading, and execution.
     """
-    def __init__(self, buttons: BadgeButtons, display: BadgeDisplay) -> None:
+    def __init__(self, buttons: BadgeButtons, display: BadgeDisplay, radio: BadgeRadio) -> None:
         self.logger = logging.getLogger("AppManager")
         self.logger.setLevel(logging.DEBUG)
 
         self.buttons = buttons
         self.display = display
+        self.radio = radio
 
         self.selected_fg_app: Optional[AppRepr] = None  # The currently selected app, if any
         self.selected_app_instance: Optional[BaseApp] = None  # The currently selected app class, if any
@@ -167,6 +177,7 @@ class AppManager:
         self.backgrounded_apps: List[AppRepr] = []  # Apps that are running in the background
 
         self.registered_apps: List[AppRepr] = []
+        self.icons = IconAtlas()  # icons of the registered apps, for the home screen
         self.scan_for_apps()
 
     def get_current_app_repr(self) -> AppRepr | None:
@@ -185,6 +196,7 @@ class AppManager:
     def scan_for_apps(self) -> None:
         """
         Scan for apps in the system and register new ones.
+        Also rebuilds the icon atlas if apps were added or removed, or their manifest or logo changed.
         """
         self.logger.info("Scanning for apps...")
         app_dirs = ['/apps/' + d[0] for d in os.ilistdir('/apps') if d[1] == 0x4000]  # 0x4000 is the directory type
@@ -223,6 +235,8 @@ class AppManager:
                 self.registered_apps.remove(known_apps[known_app_dir])
                 self.logger.info(f"Removed app: {known_app_dir}")
 
+        self.icons.update(self.registered_apps)
+
     async def scan_forever(self, interval: float = 5.0) -> None:
         """
         Continuously scan for apps at a specified interval.
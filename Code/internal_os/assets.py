@@ -0,0 +1,182 @@
+import binascii
+import framebuf
+import struct
+import os
+import logging
+import micropython
+from assetio import buffer_for, scratch
+
+try:
+    from typing import Optional, Tuple
+except ImportError:
+    # we're on an MCU, typing is not available
+    pass
+
+# Asset bundles are built on the host by tools/pack_assets.py, which documents the layout.
+ASSETS_MAGIC = b"ABN2"
+ASSETS_HEADER = "<4sHH"
+# per entry: width, height, row stride in bytes, data offset, size and CRC-32 of the source PBM, name length
+ASSETS_ENTRY = "<HHHIIIB"
+CRC_CHUNK = const(256)  # bytes of a source file hashed at a time, borrowed from the scratch arena
+
+logger = logging.getLogger("assets")
+logger.setLevel(logging.INFO)
+
+@micropython.viper
+def _invert(buf: ptr8, n: int):
+    for i in range(n):
+        buf[i] = buf[i] ^ 0xFF
+
+class AssetBundle:
+    """
+    Images packed into a single file on the host, stored exactly as they are drawn (MONO_HLSB, 1 = white),
+    so loading one is a seek and a readinto.
+    Only the offset table is kept in memory.
+    """
+    def __init__(self, path: str = "/assets.bin") -> None:
+        """
+        :param path: Path of the bundle. A missing or invalid bundle is treated as an empty one.
+        """
+        self.path = path
+        self.entries = {}  # name -> (width, height, stride, offset, source size, source CRC-32)
+        self.verified = {}  # name -> (size, mtime) of the file whose contents were found to match the bundle
+        try:
+            with open(path, "rb") as f:
+                magic, count, _ = struct.unpack(ASSETS_HEADER, f.read(struct.calcsize(ASSETS_HEADER)))
+                if magic != ASSETS_MAGIC:
+                    raise ValueError("not an asset bundle")
+                entry = bytearray(struct.calcsize(ASSETS_ENTRY))
+                for _ in range(count):
+                    if f.readinto(entry) != len(entry):
+                        raise ValueError("truncated offset table")
+                    width, height, stride, offset, source_size, source_crc, name_len = struct.unpack(ASSETS_ENTRY, entry)
+                    self.entries[f.read(name_len).decode()] = (width, height, stride, offset, source_size, source_crc)
+        except OSError:
+            pass
+        except ValueError as e:
+            logger.error(f"Ignoring asset bundle {path}: {e}")
+            self.entries = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def size(self, name: str) -> Tuple[int, int]:
+        """
+        Get the (width, height) of an image, without loading it.
+        :param name: Path of the image on the badge, e.g. "/apps/badge/badge-icon.pbm".
+        """
+        width, height, _, _, _, _ = self.entries[name]
+        return width, height
+
+    def buffer_size(self, name: str) -> int:
+        """
+        Get the number of bytes the image needs, e.g. to preallocate a buffer for load().
+        :param name: Path of the image on the badge.
+        """
+        _, height, stride, _, _, _ = self.entries[name]
+        return stride * height
+
+    def is_current(self, name: str) -> bool:
+        """
+        Check that the packed image still matches the file it was packed from, in case the file was replaced after
+        the bundle was built, e.g. the user's own /icon.pbm. A PBM's size only depends on its dimensions, so the
+        contents are compared too, by CRC-32; that is done once per version of the file, known by its size and
+        modification time. Images whose file was deleted are still considered current.
+        :param name: Path of the image on the badge.
+        """
+        try:
+            stat = os.stat(name)
+        except OSError:
+            return True
+        _, _, _, _, source_size, source_crc = self.entries[name]
+        if stat[6] != source_size:
+            return False
+        signature = (stat[6], stat[8])
+        if self.verified.get(name) == signature:
+            return True
+        try:
+            if _crc32(name) != source_crc:
+                return False
+        except OSError:
+            return False
+        self.verified[name] = signature
+        return True
+
+    def load(self, name: str, buf=None) -> Optional[framebuf.FrameBuffer]:
+        """
+        Load an image.
+        :param name: Path of the image on the badge.
+        :param buf: Buffer to load the image into, at least buffer_size(name) bytes long (a memoryview slice of a
+                    bigger buffer works), or an assetio.Arena to borrow it from. If not given, a new one is allocated.
+        :return: A FrameBuffer over the image, or None if the bundle doesn't have it.
+        """
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        width, height, stride, offset, _, _ = entry
+        length = stride * height
+        buf = buffer_for(buf, length)
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            if f.readinto(memoryview(buf)[:length]) != length:
+                raise OSError(f"Truncated asset bundle {self.path}")
+        return framebuf.FrameBuffer(buf, width, height, framebuf.MONO_HLSB)
+
+def _crc32(path: str) -> int:
+    """Get the CRC-32 of a file, reading it through the scratch arena."""
+    arena = scratch()
+    mark = arena.mark()
+    try:
+        chunk = arena.borrow(CRC_CHUNK)
+        crc = 0
+        with open(path, "rb") as f:
+            while True:
+                n = f.readinto(chunk)
+                if not n:
+                    return crc
+                crc = binascii.crc32(chunk[:n], crc)
+    finally:
+        arena.release(mark)
+
+_bundle = None
+
+def bundle() -> AssetBundle:
+    """Get the firmware's asset bundle, reading its offset table on first use."""
+    global _bundle
+    if _bundle is None:
+        _bundle = AssetBundle()
+        logger.info(f"Asset bundle has {len(_bundle.entries)} images")
+    return _bundle
+
+def load_pbm(path: str, buf=None) -> framebuf.FrameBuffer:
+    """
+    Load a PBM image (type P4) as a FrameBuffer, from the asset bundle if it has an up to date copy,
+    or by reading the file otherwise.
+    :param path: Path to the PBM file.
+    :param buf: Optional buffer to load the image into, see AssetBundle.load.
+    :return: FrameBuffer over the image.
+    """
+    return load_image(path, buf)[0]
+
+def load_image(path: str, buf=None) -> Tuple[framebuf.FrameBuffer, int, int]:
+    """
+    Like load_pbm, also returning the size of the image.
+    :return: (FrameBuffer over the image, width, height)
+    """
+    assets = bundle()
+    if path in assets and assets.is_current(path):
+        width, height = assets.size(path)
+        return assets.load(path, buf), width, height
+    with open(path, 'rb') as f:
+        if f.readline().strip() != b'P4':
+            raise ValueError("File is not a valid binary PBM file.")
+        dimensions = f.readline()
+        while dimensions.startswith(b'#'):  # skip comments, e.g. GIMP's "# Created by GIMP"
+            dimensions = f.readline()
+        width, height = map(int, dimensions.split())
+        length = (width + 7) // 8 * height
+        buf = buffer_for(buf, length)
+        if f.readinto(memoryview(buf)[:length]) != length:
+            raise ValueError("Pixel data does not match specified dimensions.")
+    _invert(buf, length)  # the e-ink means the PBM format swaps black and white
+    return framebuf.FrameBuffer(buf, width, height, framebuf.MONO_HLSB), width, height
@@ -0,0 +1,74 @@
+""" Duty-cycle limiting of the radio, charged in time on air """
+import _thread
+import time
+
+try:
+    from typing import Sequence
+except ImportError:
+    # we're on an MCU, typing is not available
+    pass
+
+class AirtimeBudget:
+    """
+    A token bucket of airtime: it refills at `duty_cycle` percent of real time, up to `burst_us`,
+    and every packet sent is charged its actual time on air.
+    Small packets go out right away while the long-term channel occupancy can't exceed the duty cycle.
+    Everything is integer microseconds, so checking the budget doesn't allocate floats.
+    The budget is checked from the app thread and charged from the OS thread, so it's updated under a lock.
+    """
+    def __init__(self, duty_cycle: float, burst_us: int, airtimes: Sequence[int]) -> None:
+        """
+        :param duty_cycle: Percentage of the time the radio may spend transmitting, in the long run.
+        :param burst_us: Most airtime that can be saved up while idle, in microseconds. At least the time on air of
+                         the biggest packet, or it could never be sent.
+        :param airtimes: Time on air of a packet of every length in bytes, from 0 to the biggest, in microseconds.
+                         Worked out once at boot, since the driver reads the packet type over SPI every time.
+        """
+        if not 0 < duty_cycle <= 100:
+            raise ValueError(f"Duty cycle must be between 0 and 100%, not {duty_cycle}")
+        self._airtimes = airtimes
+        self.lock = _thread.allocate_lock()
+        self.rate_ppm = int(duty_cycle * 10000)  # airtime earned per unit of time, in parts per million
+        self.capacity_us = burst_us
+        self.tokens_us = burst_us
+        self.last_refill = time.ticks_ms()
+        self.spent_us = 0  # total airtime charged
+
+    def time_on_air(self, length: int) -> int:
+        """Get the time on air of a packet of `length` bytes, in microseconds."""
+        if not 0 <= length < len(self._airtimes):
+            raise ValueError(f"Packets are at most {len(self._airtimes) - 1} bytes, not {length}")
+        return self._airtimes[length]
+
+    def _refill(self) -> None:
+        # must hold the lock
+        now = time.ticks_ms()
+        elapsed_ms = time.ticks_diff(now, self.last_refill)
+        if elapsed_ms <= 0:
+            return
+        self.last_refill = now
+        self.tokens_us = min(self.capacity_us, self.tokens_us + elapsed_ms * self.rate_ppm // 1000)
+
+    def remaining_us(self) -> int:
+        """Get the airtime that can be spent right now, in microseconds."""
+        with self.lock:
+            self._refill()
+            return self.tokens_us
+
+    def delay_ms(self, length: int) -> int:
+        """
+        Get the time until a packet of `length` bytes can be sent.
+        :return: Milliseconds to wait, 0 if it can be sent now.
+        """
+        missing_us = self.time_on_air(length) - self.remaining_us()
+        if missing_us <= 0:
+            return 0
+        return (missing_us * 1000 + self.rate_ppm - 1) // self.rate_ppm
+
+    def charge(self, length: int) -> None:
+        """Spend the airtime of a packet of `length` bytes that was just sent."""
+        airtime = self.time_on_air(length)
+        with self.lock:
+            self._refill()
+            self.tokens_us -= airtime
+            self.spent_us += airtime
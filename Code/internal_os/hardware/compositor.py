@@ -0,0 +1,122 @@
+import framebuf
+import utime
+
+try:
+    from typing import List, Optional, Tuple
+except ImportError:
+    # we're on an MCU, typing is not available
+    pass
+
+STATUS_BAR_HEIGHT = 12
+
+class Surface:
+    """
+    A full-width strip of the panel with its own framebuffer, copied into the panel buffer only when marked dirty.
+    Surfaces span whole rows, so copying the dirty rows is a single slice assignment.
+    """
+    def __init__(self, y: int, width: int, height: int) -> None:
+        """
+        :param y: Panel row the surface starts at.
+        :param width: Width of the panel.
+        :param height: Number of rows of the surface.
+        """
+        self.y = y
+        self.width = width
+        self.height = height
+        self.stride = width // 8
+        self.buffer = bytearray(self.stride * height)
+        self.framebuf = framebuf.FrameBuffer(self.buffer, width, height, framebuf.MONO_HLSB)
+        self.framebuf.fill(1)
+        self.dirty = (0, height)  # (first, end) rows changed since the last compose, or None
+
+    def mark_dirty(self, regions: Optional[List[Tuple[int, int, int, int]]] = None) -> None:
+        """
+        Mark regions of the surface as changed.
+        :param regions: (x, y, w, h) regions in surface coordinates, or None for the whole surface.
+        """
+        if regions is None:
+            self.dirty = (0, self.height)
+            return
+        first, end = self.dirty if self.dirty is not None else (self.height, 0)
+        for _, y, _, h in regions:
+            first = min(first, max(y, 0))
+            end = max(end, min(y + h, self.height))
+        if first < end:
+            self.dirty = (first, end)
+
+    def compose(self, buffer: bytearray) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Copy the dirty rows into the panel buffer.
+        :return: The (x, y, w, h) panel region that was copied, or None if the surface wasn't dirty.
+        """
+        if self.dirty is None:
+            return None
+        first, end = self.dirty
+        self.dirty = None
+        offset = self.y * self.stride
+        memoryview(buffer)[offset + first * self.stride:offset + end * self.stride] = memoryview(self.buffer)[first * self.stride:end * self.stride]
+        return (0, self.y + first, self.width, end - first)
+
+class Compositor:
+    """
+    Gives windowed apps (opted in with "fullScreen": false in their manifest) their own surface under an OS-owned
+    status bar, and composes both into the panel buffer when they change.
+    Full-screen apps, the default, keep drawing straight into the panel buffer.
+    The panel buffer has to stay allocated for full-screen apps and the OS, so a window costs its surfaces
+    (about 4.7 KB) on top of it, only while the windowed app runs; what it saves is bytes copied and compared
+    per update, since only the dirty rows of the surface are composed.
+    """
+    def __init__(self, width: int, height: int) -> None:
+        """
+        :param width: Width of the panel.
+        :param height: Height of the panel.
+        """
+        self.width = width
+        self.height = height
+        self.status_bar = None  # Surface, only while a windowed app is running
+        self.app_surface = None  # Surface the windowed app draws into
+        self.title = ""
+        self.clock = None  # (hour, minute) shown in the status bar
+
+    def set_app(self, title: Optional[str]) -> None:
+        """
+        Set up the surfaces for the next foreground app.
+        :param title: Name shown in the status bar for a windowed app, or None for a full-screen app (frees the surfaces).
+        """
+        if title is None:
+            self.status_bar = None
+            self.app_surface = None
+            return
+        self.title = title
+        self.status_bar = Surface(0, self.width, STATUS_BAR_HEIGHT)
+        self.app_surface = Surface(STATUS_BAR_HEIGHT, self.width, self.height - STATUS_BAR_HEIGHT)
+        self.clock = None
+
+    def _draw_status_bar(self, clock: Tuple[int, int]) -> None:
+        fb = self.status_bar.framebuf
+        fb.fill(1)
+        clock_text = f"{clock[0]:02}:{clock[1]:02}"
+        max_chars = (self.width - 8 * len(clock_text) - 8) // 8
+        fb.text(self.title[:max_chars], 0, 1, 0)
+        fb.text(clock_text, self.width - 8 * len(clock_text), 1, 0)
+        fb.hline(0, STATUS_BAR_HEIGHT - 1, self.width, 0)
+        self.status_bar.mark_dirty()
+
+    def compose(self, buffer: bytearray, regions: Optional[List[Tuple[int, int, int, int]]] = None) -> List[Tuple[int, int, int, int]]:
+        """
+        Mark the app's changes dirty and copy the dirty surfaces into the panel buffer.
+        :param buffer: The panel buffer.
+        :param regions: (x, y, w, h) regions the app changed, in its surface's coordinates, or None for all of it.
+        :return: The panel regions that were copied.
+        """
+        self.app_surface.mark_dirty(regions)
+        clock = utime.localtime()[3:5]
+        if clock != self.clock:
+            self.clock = clock
+            self._draw_status_bar(clock)
+        composed = []
+        for surface in (self.status_bar, self.app_surface):
+            region = surface.compose(buffer)
+            if region is not None:
+                composed.append(region)
+        return composed
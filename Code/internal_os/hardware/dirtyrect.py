@@ -0,0 +1,160 @@
+"""
+Dirty-rectangle tracking for the e-ink display.
+Keeps a shadow copy of the last frame that was pushed to the panel and works out which
+byte-aligned regions of the framebuffer differ from it.
+"""
+import micropython
+
+try:
+    from typing import List, Tuple
+except ImportError:
+    # we're on an MCU, typing is not available
+    pass
+
+NO_CHANGE = const(0xFF)
+
+@micropython.viper
+def _diff_rows(cur: ptr8, prev: ptr8, stride: int, y: int, y_end: int, spans: ptr8) -> int:
+    """
+    Compare rows y..y_end-1 of two MONO_HLSB buffers.
+    For each row y, spans[2y] and spans[2y+1] are set to the first and last changed byte
+    column, or to NO_CHANGE and 0 if the row is identical.
+    Returns the number of changed rows.
+    """
+    changed = 0
+    while y < y_end:
+        base = y * stride
+        lo = 0
+        while lo < stride:
+            if cur[base + lo] != prev[base + lo]:
+                break
+            lo += 1
+        if lo == stride:
+            spans[y << 1] = NO_CHANGE
+            spans[(y << 1) + 1] = 0
+        else:
+            hi = stride - 1
+            while cur[base + hi] == prev[base + hi]:
+                hi -= 1
+            spans[y << 1] = lo
+            spans[(y << 1) + 1] = hi
+            changed += 1
+        y += 1
+    return changed
+
+@micropython.viper
+def _fill(buf: ptr8, length: int, value: int):
+    for i in range(length):
+        buf[i] = value
+
+class DirtyTracker:
+    """
+    Tracks the contents of the panel so that only changed regions have to be sent to it.
+    Rectangles are (x, y, w, h) in pixels, with x and w multiples of 8.
+    """
+    def __init__(self, width: int, height: int, merge_gap: int = 8, max_rects: int = 4) -> None:
+        """
+        :param width: Width of the framebuffer in pixels (multiple of 8).
+        :param height: Height of the framebuffer in pixels.
+        :param merge_gap: Changed rows separated by at most this many unchanged rows are sent as one window.
+        :param max_rects: If more windows than this are needed, their bounding box is sent instead.
+        """
+        self.width = width
+        self.height = height
+        self.stride = width // 8
+        self.merge_gap = merge_gap
+        self.max_rects = max_rects
+        self.shadow = bytearray(self.stride * height)
+        self._spans = bytearray(2 * height)
+        self.valid = False  # the panel contents are unknown until a whole frame has been pushed
+
+    def invalidate(self) -> None:
+        """Forget the panel contents, so that the next diff covers the whole screen."""
+        self.valid = False
+
+    def commit(self, buffer, rects=None) -> None:
+        """
+        Record that the panel now shows the contents of buffer.
+        :param buffer: The framebuffer that was pushed.
+        :param rects: If given, only these (x, y, w, h) windows of buffer were pushed.
+        """
+        if rects is None or any(x <= 0 and y <= 0 and x + w >= self.width and y + h >= self.height for x, y, w, h in rects):
+            # a whole-screen window, e.g. the first partial flush after invalidate(), tells us everything
+            self.shadow[:] = buffer
+            self.valid = True
+            return
+        if not self.valid:
+            return
+        src = memoryview(buffer)
+        dst = memoryview(self.shadow)
+        for x, y, w, h in rects:
+            start = y * self.stride + (x >> 3)
+            end = start + (w >> 3)
+            for _ in range(min(h, self.height - y)):
+                dst[start:end] = src[start:end]
+                start += self.stride
+                end += self.stride
+
+    def fill(self, value: int) -> None:
+        """Record that every byte of the panel RAM was set to value."""
+        _fill(self.shadow, len(self.shadow), value)
+        self.valid = True
+
+    def diff(self, buffer, rows=None) -> List[Tuple[int, int, int, int]]:
+        """
+        Work out which regions of buffer differ from what the panel shows.
+        :param buffer: The framebuffer about to be pushed.
+        :param rows: If given, a (first, end) range of rows outside of which buffer is known not to have changed.
+        :return: A list of (x, y, w, h) windows, empty if nothing changed.
+        """
+        if not self.valid:
+            return [(0, 0, self.width, self.height)]
+        y_start, y_end = rows if rows is not None else (0, self.height)
+        y_start = max(y_start, 0)
+        y_end = min(y_end, self.height)
+        if y_start >= y_end or _diff_rows(buffer, self.shadow, self.stride, y_start, y_end, self._spans) == 0:
+            return []
+
+        # group changed rows into bands, bridging small vertical gaps
+        spans = self._spans
+        bands = []
+        band = None  # [lo, y0, hi, y1] in bytes/rows, inclusive
+        for y in range(y_start, y_end):
+            lo = spans[y << 1]
+            if lo == NO_CHANGE:
+                continue
+            hi = spans[(y << 1) + 1]
+            if band is not None and y - band[3] <= self.merge_gap + 1:
+                if lo < band[0]:
+                    band[0] = lo
+                if hi > band[2]:
+                    band[2] = hi
+                band[3] = y
+            else:
+                band = [lo, y, hi, y]
+                bands.append(band)
+
+        # merge neighbouring bands when the merged window is barely bigger than the two on their own
+        merged = [bands[0]]
+        for band in bands[1:]:
+            last = merged[-1]
+            lo = min(last[0], band[0])
+            hi = max(last[2], band[2])
+            separate = _area(last) + _area(band)
+            together = (hi - lo + 1) * (band[3] - last[1] + 1)
+            if together - separate <= self.stride * self.merge_gap:
+                last[0] = lo
+                last[2] = hi
+                last[3] = band[3]
+            else:
+                merged.append(band)
+
+        if len(merged) > self.max_rects:
+            lo = min(b[0] for b in merged)
+            hi = max(b[2] for b in merged)
+            merged = [[lo, merged[0][1], hi, merged[-1][3]]]
+
+        return [(b[0] << 3, b[1], (b[2] - b[0] + 1) << 3, b[3] - b[1] + 1) for b in merged]
+
+def _area(band) -> int:
+    return (band[2] - band[0] + 1) * (band[3] - band[1] + 1)
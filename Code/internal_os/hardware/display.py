@@ -1,5 +1,9 @@
 from machine import Pin, SPI
 from internal_os.hardware.einkdriver import EPD
+from internal_os.hardware.dirtyrect import DirtyTracker
+from internal_os.hardware.refreshpolicy import RefreshPolicy
+from internal_os.hardware.compositor import Compositor
+from internal_os.hardware import drawlist
 import logging
 import utime
 import asyncio
@@ -45,8 +49,8 @@ class LockWrapper:
 class BadgeDisplay:
     """
     Manages the display.
-    TODO: make this and einkdriver async
-    TODO: if app is not in fullscreen mode, give it a smaller framebuffer and blit it over the main framebuffer
+    Full-screen apps draw straight into the panel's framebuffer. Other apps draw into a smaller surface under
+    a status bar, which the compositor copies into the panel's framebuffer when they present a frame.
     """
     def __init__(self):
         IS_REAL_BADGE = True  # Set to False for testing on a breadboarded version
@@ -61,13 +65,60 @@ class BadgeDisplay:
         self.busy = Pin(27, Pin.IN)
 
         self.display = EPD(self.spi, self.cs, self.dc, self.rst, self.busy)
-        self.display.init()
+        self.display.tracker = DirtyTracker(self.display.width, self.display.height)
+        self.policy = RefreshPolicy(self.display.width, self.display.height)
         self.display.sleep()
 
         self.last_action = utime.ticks_ms()
         self.is_asleep = True
         self.display_lock = _thread.allocate_lock()
 
+        # Front buffer: the last frame presented by the app, waiting to be flushed by flush_forever.
+        # The app keeps drawing into self.display.buffer (the back buffer) in the meantime.
+        self.front = bytearray(self.display.buffer_size)
+        self.frame_lock = _thread.allocate_lock()  # guards self.front and the frame counters below
+        # In-flight buffer: the copy of the front buffer that flush_forever is sending, so that sending it
+        # and waiting for the panel doesn't need the frame lock
+        self.inflight = bytearray(self.display.buffer_size)
+        self.frame_ready = asyncio.ThreadSafeFlag()
+        self.frame_seq = 0       # sequence number of the last presented frame
+        self.flushed_seq = 0     # sequence number of the last frame sent to the panel
+        self.pending_full = False
+        self.pending_rows = None  # (first, end) rows the pending frame changed, None for the whole frame
+        self.front_stale = True   # whether the front buffer may differ from the back buffer outside of hinted regions
+        self.frames_dropped = 0  # presented frames that were replaced by a newer one before being flushed
+
+        # Frame pacing: flush_forever waits at least min_frame_ms between refreshes, so that frames presented
+        # in the meantime are coalesced. displayed_seq is the last frame that actually reached the panel.
+        self.min_frame_ms = 0
+        self.displayed_seq = 0
+        self.on_presented = None  # called with displayed_seq from present() when a newer frame reached the panel
+        self._reported_seq = 0
+        self._last_flush = utime.ticks_ms()
+
+        # Where the foreground app draws: the panel's framebuffer, or its surface (see set_window)
+        self.compositor = Compositor(self.display.width, self.display.height)
+        self.set_window(None)
+
+    def set_window(self, title) -> None:
+        """
+        Set up drawing for the next foreground app.
+        :param title: Name to show in the status bar for a windowed app, or None for a full-screen app.
+        """
+        self.compositor.set_app(title)
+        surface = self.compositor.app_surface
+        if surface is None:
+            self.target = self.display.framebuf
+            self.target_buffer = self.display.buffer
+            self.target_width = self.display.width
+            self.target_height = self.display.height
+        else:
+            self.target = surface.framebuf
+            self.target_buffer = surface.buffer
+            self.target_width = surface.width
+            self.target_height = surface.height
+        self.front_stale = True
+
     async def idle_when_inactive(self):
         while True:
             current_time = utime.ticks_ms()
@@ -86,16 +137,203 @@ class BadgeDisplay:
         self.logger.debug(f"Resetting idle timer from thread {_thread.get_ident()} (self.is_asleep={self.is_asleep})")
         self.last_action = utime.ticks_ms()
 
-    def show(self, full=False):
-        """Push the contents of the internal framebuffer to the display"""
+    def flush(self, full=False, buffer=None, rows=None) -> bool:
+        """
+        Push a framebuffer to the display and start the refresh, without waiting for it.
+        The framebuffer can be drawn into again as soon as this returns.
+        Partial refreshes are upgraded to full ones when the ghosting budget (see RefreshPolicy) runs out.
+        :param full: Use a full refresh instead of a partial one.
+        :param buffer: The buffer to push (defaults to the internal framebuffer).
+        :param rows: (first, end) range of rows that changed, if known. Other rows are not compared.
+        :return: Whether a refresh was started (False if nothing changed).
+        """
+        if buffer is None:
+            buffer = self.display.buffer
+            if self.compositor.app_surface is not None:
+                self.compositor.compose(buffer)
+        if buffer is not self.inflight:
+            self.front_stale = True
         self.reset_idle_timer()
         with LockWrapper(self.display_lock):
-            if full:
-                self.logger.debug("Force refreshing display")
-                self.display.display()
+            try:
+                plan = self._plan_refresh(full, buffer, rows)
+                if plan is None:
+                    return False
+                self._start_refresh(plan[0], plan[1], buffer)
+                return True
+            except Exception:
+                self._forget_panel()
+                raise
+
+    async def _flush_async(self, full, buffer, rows) -> bool:
+        """
+        Like flush(), but yields instead of blocking while the panel finishes waking up or switching between
+        full and partial mode, so the OS thread keeps running. The display lock isn't held while waiting.
+        """
+        self.reset_idle_timer()
+        try:
+            with LockWrapper(self.display_lock):
+                plan = self._plan_refresh(full, buffer, rows)
+            if plan is None:
+                return False
+            while True:
+                with LockWrapper(self.display_lock):
+                    if not self.display.prepare_step(plan[0]):
+                        # ready, and nothing else can get at the panel before the frame is sent
+                        self._start_refresh(plan[0], plan[1], buffer)
+                        return True
+                await self.display.wait_until_idle_async()
+        except Exception:
+            self._forget_panel()
+            raise
+
+    def _plan_refresh(self, full, buffer, rows):
+        """
+        Decide how to refresh the panel with buffer. Call with the display lock held.
+        :return: (full, windows to send) or None if nothing changed.
+        """
+        tracker = self.display.tracker
+        rects = None
+        if not full:
+            # only send the windows that changed since the last frame
+            rects = tracker.diff(buffer, rows)
+            if not rects:
+                self.logger.debug("Nothing changed, skipping refresh")
+                return None
+            if tracker.valid:
+                self.policy.add_damage(buffer, tracker.shadow, rects)
+            full = self.policy.needs_full()
+        return full, rects
+
+    def _start_refresh(self, full, rects, buffer) -> None:
+        """Send buffer and start the refresh planned by _plan_refresh. Call with the display lock held."""
+        if full:
+            self.logger.debug("Full refresh")
+            self.display.display(buffer, wait=False)
+            self.policy.record_full()
+        else:
+            self.logger.debug(f"Partial refresh of {rects}")
+            self.display.display_windows(rects, buffer, wait=False)
+            self.policy.record_partial()
+
+    def _forget_panel(self) -> None:
+        """The panel is in an unknown state after an error, start from scratch next time"""
+        self.display.invalidate_state()
+        self.display.tracker.invalidate()
+
+    def show(self, full=False):
+        """Push the contents of the internal framebuffer to the display and wait for the refresh to finish"""
+        if self.flush(full):
+            # the lock is not held while waiting, so the other core can keep drawing
+            self.display.wait_until_idle()
+        self.reset_idle_timer()
+
+    async def show_async(self, full=False):
+        """Push the contents of the internal framebuffer to the display and yield until the refresh finishes"""
+        if self.flush(full):
+            await self.display.wait_until_idle_async()
+        self.reset_idle_timer()
+
+    def present(self, full=False, regions=None) -> int:
+        """
+        Hand the contents of the internal framebuffer over to flush_forever and return immediately.
+        If the panel is still busy with an earlier frame, only the latest presented frame is flushed.
+        :param full: Use a full refresh for this frame (sticks until the frame is flushed).
+        :param regions: List of (x, y, w, h) regions that are the only ones changed since the last frame, if known.
+                        For windowed apps, they are relative to the app's surface.
+        :return: The sequence number of the presented frame.
+        """
+        if self.compositor.app_surface is not None:
+            # only the surface rows the app changed are copied into the panel buffer, and from there to the front buffer
+            regions = self.compositor.compose(self.display.buffer, regions)
+        with LockWrapper(self.frame_lock):
+            if regions is None or self.front_stale:
+                self.front[:] = self.display.buffer
+                self.front_stale = False
+                self.pending_rows = (0, self.display.height)
             else:
-                self.display.display(full_refresh=False)
+                # only copy (and later compare) the rows the regions span
+                stride = self.display.width // 8
+                src = memoryview(self.display.buffer)
+                dst = memoryview(self.front)
+                first, end = self.pending_rows if self.pending_rows is not None else (self.display.height, 0)
+                for _, y, _, h in regions:
+                    y0 = max(y, 0)
+                    y1 = min(y + h, self.display.height)
+                    if y0 < y1:
+                        dst[y0 * stride:y1 * stride] = src[y0 * stride:y1 * stride]
+                        first = min(first, y0)
+                        end = max(end, y1)
+                self.pending_rows = (first, end)
+            self.frame_seq += 1
+            self.pending_full = self.pending_full or full
+            seq = self.frame_seq
         self.reset_idle_timer()
+        self.frame_ready.set()
+
+        # report on the caller's thread, so that apps never have their code run on the OS thread
+        displayed = self.displayed_seq
+        if self.on_presented is not None and displayed != self._reported_seq:
+            self._reported_seq = displayed
+            self.on_presented(displayed)
+        return seq
+
+    def set_frame_rate(self, fps: float) -> None:
+        """
+        Limit how often flush_forever refreshes the panel.
+        :param fps: Maximum refreshes per second, or 0 to refresh as fast as the panel allows.
+        """
+        self.min_frame_ms = int(1000 / fps) if fps > 0 else 0
+
+    def reset_pacing(self) -> None:
+        """Go back to the default pacing and drop the presented callback, e.g. when another app is launched."""
+        self.min_frame_ms = 0
+        self.on_presented = None
+        self._reported_seq = self.displayed_seq
+
+    async def flush_forever(self):
+        """Flush presented frames to the panel as fast as it can refresh (or min_frame_ms allows). Runs on the OS thread."""
+        while True:
+            await self.frame_ready.wait()
+            while self.flushed_seq != self.frame_seq:
+                try:
+                    # anything presented while we wait here is merged into the frame we flush
+                    remaining = self.min_frame_ms - utime.ticks_diff(utime.ticks_ms(), self._last_flush)
+                    if remaining > 0:
+                        await asyncio.sleep_ms(remaining)
+                    self._last_flush = utime.ticks_ms()
+                    # only take the frame under the lock: sending it and waiting for the panel happen on the
+                    # in-flight copy, so present() never waits for the panel
+                    with LockWrapper(self.frame_lock):
+                        seq = self.frame_seq
+                        full = self.pending_full
+                        rows = self.pending_rows
+                        self.pending_full = False
+                        self.pending_rows = None
+                        self.frames_dropped += seq - self.flushed_seq - 1
+                        self.flushed_seq = seq
+                        # the in-flight copy already matches the front buffer outside of the rows presented since
+                        stride = self.display.width // 8
+                        first, end = rows if rows is not None else (0, self.display.height)
+                        memoryview(self.inflight)[first * stride:end * stride] = memoryview(self.front)[first * stride:end * stride]
+                    started = await self._flush_async(full, self.inflight, rows)
+                    if started:
+                        await self.display.wait_until_idle_async()
+                    self.displayed_seq = seq
+                except Exception as e:
+                    self.logger.error(f"Failed to flush frame: {e}")
+                    await asyncio.sleep(0.5)
+
+    def get_stats(self) -> dict:
+        """Get counters describing the display's performance"""
+        return {
+            "timings": self.display.get_timings(),
+            "refreshes": self.policy.get_stats(),
+            "frames_presented": self.frame_seq,
+            "frames_flushed": self.flushed_seq - self.frames_dropped,
+            "frames_dropped": self.frames_dropped,
+            "frames_displayed": self.displayed_seq,
+        }
 
     def sleep_disp(self):
         """Put the display to sleep to save power"""
@@ -106,36 +344,40 @@ class BadgeDisplay:
 
     def fill(self, color):
         """Fill the entire buffer with a color (0=black, 1=white)"""
-        self.display.fill(color)
+        self.target.fill(color)
 
     def pixel(self, x, y, color):
         """Set a pixel color (0=black, 1=white)"""
-        self.display.pixel(x, y, color)
+        self.target.pixel(x, y, color)
 
     def hline(self, x, y, w, color):
         """Draw a horizontal line"""
-        self.display.hline(x, y, w, color)
+        self.target.hline(x, y, w, color)
 
     def vline(self, x, y, h, color):
         """Draw a vertical line"""
-        self.display.vline(x, y, h, color)
+        self.target.vline(x, y, h, color)
 
     def line(self, x1, y1, x2, y2, color):
         """Draw a line"""
-        self.display.line(x1, y1, x2, y2, color)
+        self.target.line(x1, y1, x2, y2, color)
 
     def rect(self, x, y, w, h, color):
         """Draw a rectangle"""
-        self.display.rect(x, y, w, h, color)
+        self.target.rect(x, y, w, h, color)
 
     def fill_rect(self, x, y, w, h, color):
         """Draw a filled rectangle"""
-        self.display.fill_rect(x, y, w, h, color)
+        self.target.fill_rect(x, y, w, h, color)
 
     def text(self, text, x, y, color=0):
         """Draw text"""
-        self.display.text(text, x, y, color)
+        self.target.text(text, x, y, color)
 
     def blit(self, fb, x, y):
         """Blit a framebuffer onto the display"""
-        self.display.blit(fb, x, y)
+        self.target.blit(fb, x, y)
+
+    def draw(self, dl, fonts=None):
+        """Execute a DrawList into the framebuffer"""
+        drawlist.run(dl, self.target, self.target_buffer, self.target_width, self.target_height, fonts)
@@ -0,0 +1,221 @@
+"""
+Display lists: batches of drawing commands that are executed in one call.
+Commands are stored as fixed-size records of signed 16-bit ints (op, x, y, a, b, color) in an array.
+Pixels, lines along the axes and rectangles are drawn straight into the MONO_HLSB buffer by a viper
+loop; everything else (diagonal lines, text, blits) goes through the FrameBuffer.
+"""
+import micropython
+from array import array
+import framebuf
+
+# ops handled by the viper loop
+OP_PIXEL = const(0)
+OP_HLINE = const(1)
+OP_VLINE = const(2)
+OP_RECT = const(3)
+OP_FILL_RECT = const(4)
+_LAST_NATIVE_OP = const(4)
+# ops handled in Python; for the ones taking an object, a is its index in DrawList.objs
+OP_LINE = const(5)
+OP_TEXT = const(6)
+OP_NICE_TEXT = const(7)
+OP_BLIT = const(8)
+
+CMD_SIZE = const(6)
+
+@micropython.viper
+def _run_native(cmds: ptr16, i: int, n: int, buf: ptr8, stride: int, width: int, height: int) -> int:
+    """
+    Execute commands i..n-1 of a display list into buf.
+    Returns the index of the first command that has to be executed in Python, or n.
+    """
+    while i < n:
+        base = i * CMD_SIZE
+        op = cmds[base]
+        if op > _LAST_NATIVE_OP:
+            return i
+        # ptr16 reads are unsigned
+        x = cmds[base + 1]
+        if x & 0x8000:
+            x -= 0x10000
+        y = cmds[base + 2]
+        if y & 0x8000:
+            y -= 0x10000
+        a = cmds[base + 3]
+        if a & 0x8000:
+            a -= 0x10000
+        b = cmds[base + 4]
+        if b & 0x8000:
+            b -= 0x10000
+        fill = 0xFF if cmds[base + 5] else 0
+
+        # every op is drawn as up to 4 filled rectangles
+        parts = 1
+        if op == OP_PIXEL:
+            a = 1
+            b = 1
+        elif op == OP_HLINE:
+            b = 1
+        elif op == OP_VLINE:
+            b = a
+            a = 1
+        elif op == OP_RECT:
+            parts = 4
+        part = 0
+        while part < parts:
+            rx = x
+            ry = y
+            rw = a
+            rh = b
+            if op == OP_RECT:
+                if part == 0:
+                    rh = 1
+                elif part == 1:
+                    ry = y + b - 1
+                    rh = 1
+                elif part == 2:
+                    rw = 1
+                else:
+                    rx = x + a - 1
+                    rw = 1
+            part += 1
+
+            # clip to the buffer
+            x1 = rx + rw
+            y1 = ry + rh
+            if rx < 0:
+                rx = 0
+            if ry < 0:
+                ry = 0
+            if x1 > width:
+                x1 = width
+            if y1 > height:
+                y1 = height
+            row = ry * stride
+            while ry < y1:
+                px = rx
+                while px < x1:
+                    idx = row + (px >> 3)
+                    if (px & 7) == 0 and px + 8 <= x1:
+                        buf[idx] = fill
+                        px += 8
+                    else:
+                        bit = 0x80 >> (px & 7)
+                        buf[idx] = (buf[idx] & (0xFF ^ bit)) | (fill & bit)
+                        px += 1
+                row += stride
+                ry += 1
+        i += 1
+    return n
+
+class DrawList:
+    """
+    A reusable batch of drawing commands. Record commands with the drawing methods, then run them
+    all at once (badge.display.draw). Call clear() to reuse the list for the next frame.
+    """
+    def __init__(self, capacity: int = 64) -> None:
+        """
+        :param capacity: Number of commands to allocate room for (the list grows as needed).
+        """
+        self.cmds = array('h', [0] * (capacity * CMD_SIZE))
+        self.capacity = capacity
+        self.count = 0
+        self.objs = []  # strings, framebuffers and fonts referenced by commands
+
+    def clear(self) -> None:
+        """Remove all commands, keeping the allocated room."""
+        self.count = 0
+        self.objs.clear()
+
+    def _add(self, op: int, x: int, y: int, a: int, b: int, color: int) -> None:
+        if self.count == self.capacity:
+            self.cmds.extend(array('h', [0] * (self.capacity * CMD_SIZE)))
+            self.capacity *= 2
+        base = self.count * CMD_SIZE
+        cmds = self.cmds
+        cmds[base] = op
+        cmds[base + 1] = x
+        cmds[base + 2] = y
+        cmds[base + 3] = a
+        cmds[base + 4] = b
+        cmds[base + 5] = color
+        self.count += 1
+
+    def _add_obj(self, obj) -> int:
+        self.objs.append(obj)
+        return len(self.objs) - 1
+
+    def pixel(self, x: int, y: int, color: int) -> None:
+        """Set a pixel color (0=black, 1=white)"""
+        self._add(OP_PIXEL, x, y, 0, 0, color)
+
+    def hline(self, x: int, y: int, w: int, color: int) -> None:
+        """Draw a horizontal line"""
+        self._add(OP_HLINE, x, y, w, 0, color)
+
+    def vline(self, x: int, y: int, h: int, color: int) -> None:
+        """Draw a vertical line"""
+        self._add(OP_VLINE, x, y, h, 0, color)
+
+    def rect(self, x: int, y: int, w: int, h: int, color: int) -> None:
+        """Draw a rectangle"""
+        self._add(OP_RECT, x, y, w, h, color)
+
+    def fill_rect(self, x: int, y: int, w: int, h: int, color: int) -> None:
+        """Draw a filled rectangle"""
+        self._add(OP_FILL_RECT, x, y, w, h, color)
+
+    def line(self, x1: int, y1: int, x2: int, y2: int, color: int) -> None:
+        """Draw a line"""
+        self._add(OP_LINE, x1, y1, x2, y2, color)
+
+    def text(self, text: str, x: int, y: int, color: int = 0) -> None:
+        """Draw 8x8 text"""
+        self._add(OP_TEXT, x, y, self._add_obj(text), 0, color)
+
+    def nice_text(self, text: str, x: int, y: int, font=18, color: int = 0, *, rot: int = 0, x_spacing: int = 0, y_spacing: int = 0) -> None:
+        """Draw text using a nice font (a size from badge.display.nice_fonts or a MicroFont)"""
+        self._add(OP_NICE_TEXT, x, y, self._add_obj((text, font, rot, x_spacing, y_spacing)), 0, color)
+
+    def blit(self, fb, x: int, y: int) -> None:
+        """Blit a framebuffer"""
+        self._add(OP_BLIT, x, y, self._add_obj(fb), 0, 0)
+
+def run(dl: DrawList, fb, buf, width: int, height: int, fonts=None) -> None:
+    """
+    Execute a display list.
+    :param dl: The DrawList to execute.
+    :param fb: FrameBuffer wrapping buf.
+    :param buf: The MONO_HLSB buffer to draw into.
+    :param width: Width of the buffer in pixels.
+    :param height: Height of the buffer in pixels.
+    :param fonts: Dict of font size -> MicroFont, for nice_text commands given a size.
+    """
+    cmds = dl.cmds
+    objs = dl.objs
+    n = dl.count
+    i = 0
+    while i < n:
+        i = _run_native(cmds, i, n, buf, width >> 3, width, height)
+        if i >= n:
+            break
+        base = i * CMD_SIZE
+        op = cmds[base]
+        x = cmds[base + 1]
+        y = cmds[base + 2]
+        a = cmds[base + 3]
+        color = cmds[base + 5]
+        if op == OP_LINE:
+            fb.line(x, y, a, cmds[base + 4], color)
+        elif op == OP_TEXT:
+            fb.text(objs[a], x, y, color)
+        elif op == OP_NICE_TEXT:
+            text, font, rot, x_spacing, y_spacing = objs[a]
+            if isinstance(font, int):
+                font = fonts[font]
+            font.write(text, fb, framebuf.MONO_HLSB, width, height, x, y, color, rot=rot, x_spacing=x_spacing, y_spacing=y_spacing)
+        elif op == OP_BLIT:
+            fb.blit(objs[a], x, y)
+        else:
+            raise ValueError(f"Unknown display list op {op}")
+        i += 1
@@ -7,11 +7,15 @@ Handles low-level comms with the display
 
 import framebuf
 import utime
+import asyncio
 
 # Display resolution
 EPD_WIDTH  = 200
 EPD_HEIGHT = 200
 
+# How long the busy pin may stay high before the panel is considered stuck
+BUSY_TIMEOUT_MS = 10000
+
 # Command constants
 DRIVER_OUTPUT_CONTROL                = 0x01
 BOOSTER_SOFT_START_CONTROL           = 0x0C
@@ -108,28 +112,164 @@ class EPD:
         self.rst.init(self.rst.OUT, value=0)
         self.busy.init(self.busy.IN)
 
+        # The busy pin falls when a refresh completes; the IRQ lets callers wait for that without polling
+        self.refreshing = False
+        self.refresh_done = asyncio.ThreadSafeFlag()
+        self._refresh_start = 0
+        self.busy.irq(trigger=self.busy.IRQ_FALLING, handler=self._on_busy_falling)
+
         # Create buffer for frame
         self.buffer_size = (self.width // 8) * self.height
         self.buffer = bytearray(self.buffer_size)
         self.framebuf = framebuf.FrameBuffer(self.buffer, self.width, self.height, framebuf.MONO_HLSB)
 
+        # Preallocated SPI buffers so that sending doesn't allocate
+        self._byte_buf = bytearray(1)
+        self._white_row = b'\xff' * ((self.width + 7) // 8)
+
+        # Optional DirtyTracker that mirrors what the panel RAM holds
+        self.tracker = None
+
+        # Panel state, so the controller is only re-initialized after deep sleep or an error
+        self.awake = False       # whether init() has run since the last sleep/error
+        self.orientation = 'h'
+        self.lut_loaded = None   # waveform table the controller currently holds
+        self.mode = None         # 'partial' or 'full' once init_partial_mode/init_full_mode ran
+        self.ram_window = None   # RAM area (x_start, y_start, x_end, y_end) currently set
+        # Slow step started by prepare_step() without waiting for it: 'init' or 'mode', with when it started
+        self._busy_with = None
+        self._busy_start = 0
+
+        # Per-phase timing counters (microseconds spent / number of times run)
+        self.phase_us = {'init': 0, 'mode': 0, 'transfer': 0, 'refresh': 0}
+        self.phase_count = {'init': 0, 'mode': 0, 'transfer': 0, 'refresh': 0}
+
         # Initialize display (default to horizontal direction)
         self.init()
 
     def send_command(self, command):
         """Send command to display"""
+        self._byte_buf[0] = command
         self.dc.value(0)
         self.cs.value(0)
-        self.spi.write(bytearray([command]))
+        self.spi.write(self._byte_buf)
         self.cs.value(1)
 
     def send_data(self, data):
         """Send data to display"""
+        self._byte_buf[0] = data
+        self.dc.value(1)
+        self.cs.value(0)
+        self.spi.write(self._byte_buf)
+        self.cs.value(1)
+
+    def send_data_bulk(self, data):
+        """Send a whole buffer of data to display in a single SPI transaction"""
+        self.dc.value(1)
+        self.cs.value(0)
+        self.spi.write(data)
+        self.cs.value(1)
+
+    def write_window(self, buffer, x_byte, y, w_bytes, h, stride):
+        """
+        Stream a window of a 1-bit buffer to display RAM.
+        CS stays asserted for the whole window. If the window covers whole rows of the
+        buffer it is contiguous and goes out in a single spi.write, otherwise one
+        spi.write per row is issued from a memoryview (no copies).
+
+        Args:
+            buffer: Source buffer (MONO_HLSB)
+            x_byte: Left edge of the window, in bytes
+            y: Top edge of the window, in rows
+            w_bytes: Width of the window, in bytes
+            h: Height of the window, in rows
+            stride: Width of the source buffer, in bytes
+        """
         self.dc.value(1)
         self.cs.value(0)
-        self.spi.write(bytearray([data]))
+        if x_byte == 0 and w_bytes == stride:
+            start = y * stride
+            end = start + h * stride
+            if start == 0 and end == len(buffer):
+                self.spi.write(buffer)
+            else:
+                self.spi.write(memoryview(buffer)[start:end])
+        else:
+            mv = memoryview(buffer)
+            start = y * stride + x_byte
+            for _ in range(h):
+                self.spi.write(mv[start:start + w_bytes])
+                start += stride
         self.cs.value(1)
 
+    def ensure_ready(self):
+        """Wait for any refresh in progress, and initialize the display if it was put to sleep or lost its state"""
+        if self.refreshing or self._busy_with is not None:
+            self.wait_until_idle()
+        self._finish_busy()
+        if not self.awake:
+            self.init(self.orientation)
+
+    def prepare_step(self, full):
+        """
+        Do the next step of getting the panel ready for a full or partial refresh, without waiting on the busy pin:
+        initialize it if it was put to sleep, or switch between full and partial mode.
+        Lets the caller wait for these (the mode switch takes as long as a refresh) with wait_until_idle_async().
+
+        Args:
+            full: Get ready for a full refresh instead of a partial one
+
+        Returns:
+            True if the panel is busy, and prepare_step has to be called again once it's idle. False when it's ready
+        """
+        if (self.refreshing or self._busy_with is not None) and self.is_busy():
+            return True
+        self._finish_busy()
+        if not self.awake:
+            self._init_start(self.orientation)
+            return True
+        if full:
+            return self.init_full_mode(wait=False)
+        return self.init_partial_mode(wait=False)
+
+    def _finish_busy(self):
+        """Wrap up whatever the panel was busy with, once it's idle"""
+        self._refresh_finished()
+        busy_with = self._busy_with
+        self._busy_with = None
+        if busy_with == 'init':
+            self._init_finish()
+        elif busy_with == 'mode':
+            self._phase_done('mode', self._busy_start)
+
+    def invalidate_state(self):
+        """Forget the panel state, so that the next update re-initializes it (e.g. after an error)"""
+        self.awake = False
+        self.lut_loaded = None
+        self.mode = None
+        self.ram_window = None
+        self._busy_with = None
+
+    def _phase_done(self, phase, start):
+        """Add the time since start (from utime.ticks_us) to a phase's timing counter"""
+        self.phase_us[phase] += utime.ticks_diff(utime.ticks_us(), start)
+        self.phase_count[phase] += 1
+
+    def get_timings(self):
+        """
+        Get the per-phase timing counters
+
+        Returns:
+            dict of phase -> (total microseconds, number of times run)
+        """
+        return {phase: (self.phase_us[phase], self.phase_count[phase]) for phase in self.phase_us}
+
+    def reset_timings(self):
+        """Zero the per-phase timing counters"""
+        for phase in self.phase_us:
+            self.phase_us[phase] = 0
+            self.phase_count[phase] = 0
+
     def reset(self):
         """Reset the display"""
         self.rst.value(1)
@@ -140,21 +280,62 @@ class EPD:
         utime.sleep_ms(20)
 
     def wait_until_idle(self):
-        """Wait until the busy pin goes HIGH"""
+        """Wait until the busy pin goes LOW"""
+        start = utime.ticks_ms()
         while self.busy.value() == 1:      # LOW: idle, HIGH: busy
-            utime.sleep_ms(100)
-        utime.sleep_ms(200)
+            if utime.ticks_diff(utime.ticks_ms(), start) > BUSY_TIMEOUT_MS:
+                self.invalidate_state()
+                raise RuntimeError("Display stayed busy for too long")
+            utime.sleep_ms(5)
+        self._refresh_finished()
+
+    async def wait_until_idle_async(self):
+        """Wait until the busy pin goes LOW, yielding to other tasks in the meantime"""
+        start = utime.ticks_ms()
+        while self.busy.value() == 1:
+            if utime.ticks_diff(utime.ticks_ms(), start) > BUSY_TIMEOUT_MS:
+                self.invalidate_state()
+                raise RuntimeError("Display stayed busy for too long")
+            try:
+                # the IRQ wakes us up; the timeout only guards against a missed edge
+                await asyncio.wait_for_ms(self.refresh_done.wait(), 100)
+            except asyncio.TimeoutError:
+                pass
+        self._refresh_finished()
+
+    def is_busy(self):
+        """Whether the panel is still refreshing"""
+        return self.busy.value() == 1
+
+    def _on_busy_falling(self, pin):
+        """IRQ: the panel finished whatever it was doing"""
+        self._refresh_finished()
+        self.refresh_done.set()
+
+    def _start_refresh(self, wait):
+        """Mark a refresh as started by MASTER_ACTIVATION, and wait for it if asked to"""
+        self._refresh_start = utime.ticks_us()
+        self.refreshing = True
+        if wait:
+            self.wait_until_idle()
+
+    def _refresh_finished(self):
+        """Record the end of a refresh started by _start_refresh (if one was running)"""
+        if self.refreshing:
+            self.refreshing = False
+            self._phase_done('refresh', self._refresh_start)
 
     def lut(self, lut_array):
-        """Send lookup table to display"""
+        """Send lookup table to display (the 153 waveform bytes, in a single transfer)"""
         self.send_command(WRITE_LUT_REGISTER)
-        for i in range(153):
-            self.send_data(lut_array[i])
-        self.wait_until_idle()
+        self.send_data_bulk(memoryview(lut_array)[:153])
 
     def set_lut(self, lut_array):
-        """Set lookup table and related registers"""
+        """Set lookup table and related registers (does nothing if the controller already holds this table)"""
+        if self.lut_loaded is lut_array:
+            return
         self.lut(lut_array)
+        self.lut_loaded = lut_array
 
         self.send_command(0x3f)
         self.send_data(lut_array[153])
@@ -177,6 +358,14 @@ class EPD:
         Args:
             orientation: 'h' for horizontal (default) or 'v' for vertical
         """
+        self._init_start(orientation)
+        self.wait_until_idle()
+        self._finish_busy()
+
+    def _init_start(self, orientation):
+        """Reset and configure the controller, up to loading the waveform, which keeps the panel busy for a while"""
+        start = utime.ticks_us()
+        self.invalidate_state()
         self.reset()
 
         self.wait_until_idle()
@@ -234,64 +423,75 @@ class EPD:
         self.send_data(0xC7)
         self.send_data(0x00)
 
-        self.wait_until_idle()
+        self.orientation = orientation
+        self._busy_with = 'init'
+        self._busy_start = start
 
+    def _init_finish(self):
+        """Finish init() once the waveform is loaded"""
         # Set LUT
         self.set_lut(WF_PARTIAL_1IN54_0)
 
-    def clear(self):
-        """Clear the display with white"""
+        if self.orientation == 'h':
+            self.ram_window = (0, 0xC7, 199, 0)
+        else:
+            self.ram_window = (0, 0, 199, 199)
+        self.awake = True
+        self._phase_done('init', self._busy_start)
+
+    def clear(self, wait=True):
+        """
+        Clear the display with white
+
+        Args:
+            wait: Wait for the refresh to finish before returning
+        """
         w = (self.width + 7) // 8  # Width in bytes, ceiling division
         h = self.height
 
+        self.ensure_ready()
+        start = utime.ticks_us()
+        self._set_window(0, 0, self.width - 1, h - 1)
         self.send_command(WRITE_RAM)
-        for j in range(h):
-            for i in range(w):
-                self.send_data(0xFF)  # White
+        self.dc.value(1)
+        self.cs.value(0)
+        for _ in range(h):
+            self.spi.write(self._white_row)  # White
+        self.cs.value(1)
+        if self.tracker is not None:
+            self.tracker.fill(0xFF)
+        self._phase_done('transfer', start)
 
         # Display refresh
-        self.display_frame()
+        self.display_frame(wait)
 
-    def display(self, buffer=None, full_refresh=True):
+    def display(self, buffer=None, full_refresh=True, wait=True):
         """
         Display a frame buffer
 
         Args:
             buffer: Buffer to display (uses internal buffer if None)
+            full_refresh: Use the full waveform (slow, clears ghosting) instead of the partial one
+            wait: Wait for the refresh to finish before returning
         """
-        #self.reset()
-        #self.init_full_mode()
-        self.init()
-
         if buffer is None:
             buffer = self.buffer
 
-        w = (self.width + 7) // 8  # Width in bytes, ceiling division
-        h = self.height
-
-        self.send_command(WRITE_RAM)  # Write to RAM area 0x24
-        for j in range(h):
-            for i in range(w):
-                self.send_data(buffer[i + j * w])
-
-
-        # Display refresh
         if full_refresh:
-            self.display_base_image()
+            self.display_base_image(buffer, wait)
         else:
-            print("Partial refresh")
-            self.display_frame()
+            self.display_windows([(0, 0, self.width, self.height)], buffer, wait)
 
-    def display_base_image(self, buffer=None):
+    def display_base_image(self, buffer=None, wait=True):
         """
         Display a base image for partial refresh mode
         This writes to both RAM areas to ensure consistent partial updates
 
         Args:
             buffer: Buffer to display (uses internal buffer if None)
+            wait: Wait for the refresh to finish before returning
         """
-        # Reset display to clear any partial display settings
-        self.reset()
+        self.ensure_ready()
         self.init_full_mode()
 
         if buffer is None:
@@ -300,13 +500,15 @@ class EPD:
         w = (self.width + 7) // 8  # Width in bytes, ceiling division
         h = self.height
 
+        start = utime.ticks_us()
+        self._set_window(0, 0, self.width - 1, h - 1)
         self.send_command(WRITE_RAM)  # Write to RAM area 0x24
-        for j in range(h):
-            for i in range(w):
-                self.send_data(buffer[i + j * w])
+        self.write_window(buffer, 0, 0, w, h, w)
+        self._frame_written(buffer)
+        self._phase_done('transfer', start)
 
         # Display refresh with full update
-        self.display_frame()
+        self.display_frame(wait)
 
     def display_partial(self, x=0, y=0, w=None, h=None, buffer=None):
         """
@@ -332,37 +534,57 @@ class EPD:
         x &= 0xF8  # Force to be multiple of 8
         w &= 0xF8  # Force to be multiple of 8
 
-        # Calculate end positions
-        x_end = min(x + w - 1, self.width - 1)
-        y_end = min(y + h - 1, self.height - 1)
+        self.display_windows([(x, y, w, h)], buffer)
+
+    def display_windows(self, rects, buffer=None, wait=True):
+        """
+        Perform a partial update of several regions of the display, with a single refresh
+
+        Args:
+            rects: List of (x, y, w, h) regions to update (x and w must be multiples of 8)
+            buffer: Buffer to display (uses internal buffer if None)
+            wait: Wait for the refresh to finish before returning
+        """
+        if buffer is None:
+            buffer = self.buffer
+
+        buffer_width = (self.width + 7) // 8
 
         # Initialize partial refresh mode
+        self.ensure_ready()
         self.init_partial_mode()
 
-        # Set the area to update
-        self.set_memory_area(x, y, x_end, y_end)
-        self.set_memory_pointer(x, y)
+        start = utime.ticks_us()
+        for x, y, w, h in rects:
+            # Calculate end positions
+            x_end = min(x + w - 1, self.width - 1)
+            y_end = min(y + h - 1, self.height - 1)
 
-        # Calculate buffer offsets and sizes
-        bytes_per_line = (w + 7) // 8
-        buffer_width = (self.width + 7) // 8
+            # Set the area to update
+            self._set_window(x, y, x_end, y_end)
 
-        # Send data for the specified region
-        self.send_command(WRITE_RAM)
-        for j in range(y, y_end + 1):
-            for i in range(x // 8, (x_end // 8) + 1):
-                # Get the data from the buffer
-                # Adjust index based on full buffer width
-                index = i + j * buffer_width
-                self.send_data(buffer[index])
+            # Send data for the specified region
+            self.send_command(WRITE_RAM)
+            self.write_window(buffer, x // 8, y, (x_end // 8) - (x // 8) + 1, y_end - y + 1, buffer_width)
+        self._frame_written(buffer, rects)
+        self._phase_done('transfer', start)
 
         # Partial display refresh
-        self.display_partial_frame()
+        self.display_partial_frame(wait)
 
-    def init_partial_mode(self):
-        """Initialize the display for partial refresh mode"""
-        # Reset display
-        self.reset()
+    def init_partial_mode(self, wait=True):
+        """
+        Initialize the display for partial refresh mode (does nothing if already in it)
+
+        Args:
+            wait: Wait for the switch to finish. If False, use is_busy()/wait_until_idle_async() to find out when it does
+
+        Returns:
+            Whether a switch was started
+        """
+        if self.mode == 'partial':
+            return False
+        self._busy_start = utime.ticks_us()
 
         # Set LUT for partial update
         self.set_lut(WF_PARTIAL_1IN54_0)
@@ -386,12 +608,26 @@ class EPD:
         self.send_command(DISPLAY_UPDATE_CONTROL_2)
         self.send_data(0xC0)
         self.send_command(MASTER_ACTIVATION)
-        self.wait_until_idle()
+        self.mode = 'partial'
+        self._busy_with = 'mode'
+        if wait:
+            self.wait_until_idle()
+            self._finish_busy()
+        return True
+
+    def init_full_mode(self, wait=True):
+        """
+        Initialize the display for full refresh mode (does nothing if already in it)
 
-    def init_full_mode(self):
-        """Initialize the display for full refresh mode"""
-        # Reset display
-        self.reset()
+        Args:
+            wait: Wait for the switch to finish. If False, use is_busy()/wait_until_idle_async() to find out when it does
+
+        Returns:
+            Whether a switch was started
+        """
+        if self.mode == 'full':
+            return False
+        self._busy_start = utime.ticks_us()
 
         # Set LUT for full update
         self.set_lut(WF_FULL_1IN54)
@@ -402,7 +638,12 @@ class EPD:
         self.send_command(DISPLAY_UPDATE_CONTROL_2)
         self.send_data(0xC7)  # Option for LUT from register - full refresh
         self.send_command(MASTER_ACTIVATION)
-        self.wait_until_idle()
+        self.mode = 'full'
+        self._busy_with = 'mode'
+        if wait:
+            self.wait_until_idle()
+            self._finish_busy()
+        return True
 
     def set_memory_area(self, x_start, y_start, x_end, y_end):
         """
@@ -414,6 +655,11 @@ class EPD:
             x_end: X end position
             y_end: Y end position
         """
+        window = (x_start, y_start, x_end, y_end)
+        if window == self.ram_window:
+            return
+        self.ram_window = window
+
         self.send_command(SET_RAM_X_ADDRESS_START_END_POSITION)
         # x point must be the multiple of 8 or the last 3 bits will be ignored
         self.send_data((x_start >> 3) & 0xFF)
@@ -443,22 +689,47 @@ class EPD:
 
         self.wait_until_idle()
 
-    def display_frame(self):
-        """Update the display (full refresh)"""
+    def _set_window(self, x, y, x_end, y_end):
+        """
+        Set the RAM area and pointer for a window given in framebuffer coordinates
+
+        Args:
+            x: X start position (multiple of 8)
+            y: Y start position
+            x_end: X end position
+            y_end: Y end position
+        """
+        if self.orientation == 'h':
+            # the gates are scanned bottom-to-top (see init), so RAM rows run opposite to framebuffer rows
+            y = self.height - 1 - y
+            y_end = self.height - 1 - y_end
+        self.set_memory_area(x, y, x_end, y_end)
+        self.set_memory_pointer(x, y)
+
+    def display_frame(self, wait=True):
+        """
+        Update the display (full refresh)
+
+        Args:
+            wait: Wait for the refresh to finish. If False, use is_busy()/wait_until_idle_async() to find out when it does
+        """
         self.send_command(DISPLAY_UPDATE_CONTROL_2)
         self.send_data(0xC7)
         self.send_command(MASTER_ACTIVATION)
-        self.wait_until_idle()
+        self._start_refresh(wait)
 
-    def display_partial_frame(self):
+    def display_partial_frame(self, wait=True):
         """
         Update the display using partial refresh mode
         This is faster but may cause some ghosting over time
+
+        Args:
+            wait: Wait for the refresh to finish. If False, use is_busy()/wait_until_idle_async() to find out when it does
         """
         self.send_command(DISPLAY_UPDATE_CONTROL_2)
         self.send_data(0xCF)  # Option for LUT from register - partial refresh
         self.send_command(MASTER_ACTIVATION)
-        self.wait_until_idle()
+        self._start_refresh(wait)
 
     def set_frame_memory(self, image_buffer, x, y, image_width, image_height):
         """
@@ -476,11 +747,7 @@ class EPD:
                 y < 0 or image_height < 0):
             return
 
-        # Reset display
-        self.rst.value(0)  # Module reset
-        utime.sleep_ms(2)
-        self.rst.value(1)
-        utime.sleep_ms(2)
+        self.ensure_ready()
 
         self.send_command(0x3C)
         self.send_data(0x80)
@@ -499,14 +766,13 @@ class EPD:
         else:
             y_end = y + image_height - 1
 
-        self.set_memory_area(x, y, x_end, y_end)
-        self.set_memory_pointer(x, y)
+        self._set_window(x, y, x_end, y_end)
 
         self.send_command(WRITE_RAM)
         # Send the image data
-        for j in range(y_end - y + 1):
-            for i in range((x_end - x + 1) // 8):
-                self.send_data(image_buffer[i + j * (image_width // 8)])
+        self.write_window(image_buffer, 0, 0, (x_end - x + 1) // 8, y_end - y + 1, image_width // 8)
+        if self.tracker is not None:
+            self.tracker.invalidate()
 
     def set_frame_memory_partial(self, image_buffer, x, y, image_width, image_height):
         """
@@ -526,6 +792,7 @@ class EPD:
             return
 
         # Initialize partial refresh mode
+        self.ensure_ready()
         self.init_partial_mode()
 
         # x point must be the multiple of 8 or the last 3 bits will be ignored
@@ -542,21 +809,33 @@ class EPD:
         else:
             y_end = y + image_height - 1
 
-        self.set_memory_area(x, y, x_end, y_end)
-        self.set_memory_pointer(x, y)
+        self._set_window(x, y, x_end, y_end)
 
         self.send_command(WRITE_RAM)
         # Send the image data
         bytes_per_line = image_width // 8
-        for j in range(y_end - y + 1):
-            for i in range((x_end - x + 1) // 8):
-                self.send_data(image_buffer[i + j * bytes_per_line])
+        self.write_window(image_buffer, 0, 0, (x_end - x + 1) // 8, y_end - y + 1, bytes_per_line)
+        if self.tracker is not None:
+            self.tracker.invalidate()
+
+    def _frame_written(self, buffer, rects=None):
+        """Tell the tracker (if any) that the panel RAM now matches a frame buffer, or some windows of it"""
+        if self.tracker is None:
+            return
+        if len(buffer) == self.buffer_size:
+            self.tracker.commit(buffer, rects)
+        else:
+            self.tracker.invalidate()
 
     def sleep(self):
         """Put display into deep sleep mode to save power"""
+        if self.refreshing or self._busy_with is not None:
+            self.wait_until_idle()
+        self._busy_with = None
         self.send_command(DEEP_SLEEP_MODE)
         self.send_data(0x01)
         utime.sleep_ms(200)
+        self.invalidate_state()
 
         # Pull reset pin low to ensure sleep mode
         self.rst.value(0)
@@ -0,0 +1,49 @@
+""" Listen-before-talk backoff for the radio """
+import random
+
+try:
+    from typing import Dict
+except ImportError:
+    # we're on an MCU, typing is not available
+    pass
+
+BACKOFF_SLOT_MS = 20  # about the time on air of a short packet
+MAX_BACKOFF_EXP = 5  # the backoff window stops doubling at 32 slots
+MAX_ATTEMPTS = 7  # channel checks before a packet is given up on
+
+class ListenBeforeTalk:
+    """
+    When to check the channel again after channel activity detection (CAD) found it busy, and counters of how often
+    that happens. After the n-th busy check (counting from 0) it waits between 1 and 2^(n+1) slots, picked at random
+    so that badges that backed off from the same transmission don't all check again at the same time.
+    """
+    def __init__(self, slot_ms: int = BACKOFF_SLOT_MS, max_exp: int = MAX_BACKOFF_EXP, max_attempts: int = MAX_ATTEMPTS) -> None:
+        """
+        :param slot_ms: Backoff unit, in milliseconds.
+        :param max_exp: Retry after which the backoff window stops growing.
+        :param max_attempts: Number of channel checks before giving up on a packet.
+        """
+        self.slot_ms = slot_ms
+        self.max_exp = max_exp
+        self.max_attempts = max_attempts
+        self.checks = 0  # channel checks done
+        self.busy = 0  # channel checks that found the channel busy
+        self.retries = 0  # channel checks done again after a busy one
+        self.gave_up = 0  # packets dropped after max_attempts busy checks
+
+    def backoff_ms(self, attempt: int) -> int:
+        """
+        Get the time to wait after the channel was found busy.
+        :param attempt: Number of the check that found it busy, starting at 0.
+        """
+        slots = 1 << min(attempt + 1, self.max_exp)
+        return self.slot_ms * (1 + random.getrandbits(8) % slots)
+
+    def stats(self) -> Dict[str, int]:
+        """Get the counters."""
+        return {
+            "checks": self.checks,
+            "busy": self.busy,
+            "retries": self.retries,
+            "gave_up": self.gave_up,
+        }
@@ -1,18 +1,39 @@
 """ Abstraction of the radio driver """
 import asyncio
+from array import array
 from machine import I2C, Pin
 from internal_os.hardware.utils import unique_id
 import time
 
 try:
-    from typing import List
+    from typing import Callable, List, Optional
 except ImportError:
     # we're on an MCU, typing is not available
     pass
 
 from sx1262 import SX1262
+from _sx126x import ERR_NONE, ERROR, SX126X_IRQ_CAD_DETECTED, SX126X_IRQ_CAD_DONE
+from internal_os.hardware.airtime import AirtimeBudget
+from internal_os.hardware.lbt import ListenBeforeTalk
+from internal_os.hardware.radioqueue import RingBuffer, TxScheduler, DROP_OLDEST, PRIORITY_NORMAL, PRIORITY_SYSTEM
 import logging
 
+RX_QUEUE_SIZE = 16
+RX_APP_QUOTA = 8  # so a chatty app can't push every other app's packets out of the rx queue
+TX_APP_QUEUE_SIZE = 4  # packets each app can have waiting
+TX_SYSTEM_QUEUE_SIZE = 8
+SENT_QUEUE_SIZE = 16  # sent packets whose on_sent callback the app thread hasn't called yet
+PACKET_HEADER_SIZE = 6
+MAX_PACKET_SIZE = 255  # bytes on air, header included
+MAX_PAYLOAD_SIZE = MAX_PACKET_SIZE - PACKET_HEADER_SIZE
+BROADCAST_ADDRESS = 0xFFFF
+ANNOUNCEMENT_APP_NUMBER = 0x0B  # announcements are handled by the mobile app on every badge
+# Percentage of the time the radio may spend transmitting. None matches the occupancy of the old fixed limit,
+# a packet of the maximum size every 1.5 s (about 10% at SF7, 500 kHz, CR 4/8).
+DUTY_CYCLE_PERCENT = None
+LEGACY_MS_PER_PACKET = 1500
+CAD_TIMEOUT_MS = 20  # CAD takes about 1 ms at SF7, 500 kHz; if DIO1 hasn't risen by then, it never will
+
 sx = SX1262(
     spi_bus=0,
     clk=18, mosi=19, miso=20,
@@ -23,7 +44,7 @@ class Packet:
     """
     Represents a packet.
     """
-    def __init__(self, dest: int, app_number: int, data: bytes):
+    def __init__(self, dest: int, app_number: int, data: bytes, on_sent: Optional[Callable] = None):
         if not isinstance(dest, int):
             raise TypeError("dest must be an integer")
         if not isinstance(app_number, int):
@@ -34,6 +55,8 @@ class Packet:
         self.dest = dest
         self.app_number = app_number
         self.data = data
+        self.on_sent = on_sent  # for packets being sent, called with (packet, sent) once it's done
+        self.sent = False  # for packets being sent, whether the radio sent it, once it's done
 
     def __repr__(self):
         return f"Packet(source={self.source:x}, dest={self.dest:x}, app_number={self.app_number}, data={self.data})"
@@ -56,10 +79,16 @@ class BadgeRadio:
         self.logger = logging.getLogger("BadgeRadio")
         self.logger.setLevel(logging.DEBUG)
 
-        self._receive_queue = []  # rx queue
-        self._transmit_queue = [] # tx queue
-
-        self.last_tx_time = time.ticks_ms()
+        # allocated here, at boot, so queueing a packet never allocates
+        # rx: filled by the radio IRQ, newer packets are more relevant than stale ones
+        self._receive_queue = RingBuffer(RX_QUEUE_SIZE, DROP_OLDEST, RX_APP_QUOTA)
+        # sent packets with an on_sent callback: filled by the OS thread, drained by the app thread
+        self._sent_queue = RingBuffer(SENT_QUEUE_SIZE, DROP_OLDEST)
+        # set when a packet lands in the rx queue (from the radio IRQ) or the tx queue (from any thread)
+        self._rx_ready = asyncio.ThreadSafeFlag()
+        self._tx_ready = asyncio.ThreadSafeFlag()
+        self.lbt = ListenBeforeTalk()
+        self._tx_end = time.ticks_ms()  # when the packet being sent is done, the radio can't do CAD before that
 
         sx.begin(
             freq=923, bw=500.0, sf=7, cr=8, syncWord=0x12,
@@ -69,6 +98,20 @@ class BadgeRadio:
             tcxoVoltage=0, useRegulatorLDO=False, # crystal, dcdc regulator
             blocking=False # used with a callback
         )
+
+        # time on air depends on the modulation, so this needs the radio configured. The driver reads the packet
+        # type over SPI for every call, so it's done once here, on the OS thread, and never from the app thread.
+        airtimes = array('I', [sx.getTimeOnAir(length) for length in range(MAX_PACKET_SIZE + 1)])
+        max_airtime = airtimes[MAX_PACKET_SIZE]
+        duty_cycle = DUTY_CYCLE_PERCENT
+        if duty_cycle is None:
+            duty_cycle = max_airtime / (LEGACY_MS_PER_PACKET * 10)
+        # idle time saves up enough airtime for one packet of the maximum size
+        self.airtime = AirtimeBudget(duty_cycle, max_airtime, airtimes)
+        self.logger.info(f"Airtime budget: {duty_cycle:.1f}% duty cycle, {max_airtime} us per max size packet")
+        # tx: one queue per app, apps take turns so none can starve the others, system packets go first
+        self._transmit_queue = TxScheduler(TX_APP_QUEUE_SIZE, TX_SYSTEM_QUEUE_SIZE, self._packet_cost, max_airtime)
+
         sx.setBlockingCallback(False, self._lora_callback)
 
     def _lora_callback(self, events):
@@ -76,10 +119,11 @@ class BadgeRadio:
             msg, status = sx.recv()
             self._handle_packet(msg)
 
-    def _send_msg(self, dest: bytes, target_app: bytes, message: bytes):
+    def _send_msg(self, dest: bytes, target_app: bytes, message: bytes) -> int:
         """
         Sends a message over LoRa.
         Takes in app ID, and optional message type. If ommited, it's an announcement.
+        Returns the driver's state, ERR_NONE if the radio started transmitting.
         """
 
         """ bytes 0-1: source addr
@@ -96,7 +140,12 @@ class BadgeRadio:
         msg_bytes[6:] = message
         self.logger.debug(f"Sending message: {msg_bytes}")
 
-        sx.send(msg_bytes)
+        _, state = sx.send(msg_bytes)
+        if state != ERR_NONE:
+            return state
+        self.airtime.charge(len(msg_bytes))
+        self._tx_end = time.ticks_add(time.ticks_ms(), self.airtime.time_on_air(len(msg_bytes)) // 1000 + 1)
+        return state
 
     def _handle_packet(self, packet) -> None:
         """
@@ -119,9 +168,15 @@ class BadgeRadio:
             logging.debug(f"Packet not for this badge: {pkt.dest:x} != {int.from_bytes(unique_id()[-2:], 'big'):x} or not broadcast")
             return
 
-        self._receive_queue.append(pkt)  # add packet to the rx queue
+        if not self._receive_queue.push(pkt, pkt.app_number):
+            logging.warning(f"Receive queue full, dropped packet for app {pkt.app_number}")
+
+        # dispatching is handled in dispatch_forever, wake it up
+        self._rx_ready.set()
 
-        # dispatching is handled in manage_packets_forever
+    def _packet_cost(self, pkt: Packet) -> int:
+        """Time on air of a packet, counted against its app's turn in the transmit scheduler."""
+        return self.airtime.time_on_air(PACKET_HEADER_SIZE + len(pkt.data))
 
     def get_packets_available(self) -> int:
         """
@@ -134,51 +189,211 @@ class BadgeRadio:
         Retrieves and removes the next packet from the receive queue.
         Returns None if the queue is empty.
         """
-        if self._receive_queue:
-            return self._receive_queue.pop(0)
-        return None
+        return self._receive_queue.pop()
 
-    def get_send_queue_size(self) -> int:
+    def get_send_queue_size(self, app_number: int = None) -> int:
         """
         Returns the number of packets in the send queue.
+        :param app_number: Only count the packets of this app.
+        """
+        if app_number is None:
+            return len(self._transmit_queue)
+        return self._transmit_queue.count(app_number)
+
+    def can_send(self, app_number: int, priority: int = PRIORITY_NORMAL) -> bool:
+        """
+        Returns whether add_to_tx_queue would accept a packet from this app right now.
+        """
+        return self._transmit_queue.can_push(app_number, priority)
+
+    def get_queue_stats(self) -> dict:
         """
-        return len(self._transmit_queue)
+        Returns the length and counters (enqueued, dropped, high water mark) of the rx queue, and of the tx system
+        queue and each app's tx queue.
+        """
+        return {"rx": self._receive_queue.stats(), "tx": self._transmit_queue.stats()}
+
+    def get_time_to_next_send(self, size: int = MAX_PAYLOAD_SIZE) -> float:
+        """
+        Returns the time in seconds until the airtime budget allows sending a packet.
+        :param size: Size of the packet's payload, in bytes. Defaults to the largest payload.
+        """
+        return self.airtime.delay_ms(PACKET_HEADER_SIZE + size) / 1000
+
+    def get_channel_stats(self) -> dict:
+        """
+        Returns the listen-before-talk counters: channel checks, how many found the channel busy, retries, and
+        packets given up on.
+        """
+        return self.lbt.stats()
 
-    def get_time_to_next_send(self) -> float:
+    def get_airtime_budget(self) -> int:
         """
-        Returns the time in seconds until the next packet can be sent.
+        Returns the airtime that can be spent transmitting right now, in microseconds.
         """
-        current_time = time.ticks_ms()
-        elapsed_time = time.ticks_diff(current_time, self.last_tx_time)
-        ms_per_packet = 1500
-        return max(0, (ms_per_packet - elapsed_time) / 1000.0)
+        return self.airtime.remaining_us()
 
-    def add_to_tx_queue(self, dest: int, app_number: int, data: bytes):
+    def add_to_tx_queue(self, dest: int, app_number: int, data: bytes, priority: int = PRIORITY_NORMAL, on_sent: Optional[Callable] = None) -> bool:
         """
         Adds a packet to the transmit queue.
+        :param priority: PRIORITY_NORMAL for app traffic, PRIORITY_SYSTEM for OS traffic that has to jump the line.
+        :param on_sent: Called with (packet, sent) once the packet was handed to the radio, on the app thread between
+                        two loop() calls (see report_sent).
+        :return: Whether the packet was queued, False if the app's queue is full.
+        :raises ValueError: If data doesn't fit in a packet.
         """
-        pkt = Packet(dest, app_number, data)
-        self._transmit_queue.append(pkt)
+        if len(data) > MAX_PAYLOAD_SIZE:
+            raise ValueError(f"data is {len(data)} bytes, a packet holds at most {MAX_PAYLOAD_SIZE}")
+        pkt = Packet(dest, app_number, data, on_sent)
+        if not self._transmit_queue.push(pkt, priority):
+            logging.info(f"Transmit queue full, dropped packet: {pkt}")
+            return False
+        self._tx_ready.set()
         logging.info(f"Added packet to transmit queue: {pkt}")
+        return True
+
+    def send_announcement(self, data: bytes, on_sent: Optional[Callable] = None) -> bool:
+        """
+        Broadcasts an announcement to every badge, whichever app sends it.
+        Announcements are OS traffic: they go in the system queue, ahead of every app's packets, and don't count
+        against the queue of the app whose number they carry.
+        :return: Whether the announcement was queued, False if the system queue is full.
+        """
+        return self.add_to_tx_queue(BROADCAST_ADDRESS, ANNOUNCEMENT_APP_NUMBER, data, PRIORITY_SYSTEM, on_sent)
 
     async def manage_packets_forever(self):
+        """
+        Dispatch received packets and send queued ones. Runs on the OS thread.
+        Both sides sleep until there is something to do, instead of polling.
+        """
+        await asyncio.gather(self.dispatch_forever(), self.transmit_forever())
+
+    async def dispatch_forever(self):
+        """Hand every received packet to its app as soon as the radio IRQ queues it."""
         while True:
-            # manage the transmission rate and dispatch packets
-            if len(self._receive_queue) > 0:
+            await self._rx_ready.wait()
+            # drain the whole queue, packets that arrive meanwhile are picked up by this loop too
+            packet = self.get_next_packet()
+            while packet is not None:
+                logging.info(f"Dispatching packet: {packet}")
+                self.internal_os.apps.dispatch_packet(packet)
                 packet = self.get_next_packet()
-                if packet:
-                    logging.info(f"Dispatching packet: {packet}")
-                    self.internal_os.apps.dispatch_packet(packet)
-
-            if len(self._transmit_queue) > 0:
-                # handle sending packets
-                self.logger.debug(f"Transmit queue size: {len(self._transmit_queue)}")
-                if self.get_time_to_next_send() <= 0:
-                    pkt = self._transmit_queue.pop(0)
-                    self.logger.debug(f"Sending packet: {pkt}")
-                    self._send_msg(pkt.dest.to_bytes(2, 'big'), pkt.app_number.to_bytes(2, 'big'), pkt.data)
-                    self.logger.info(f"Sent packet: {pkt}")
-                    self.last_tx_time = time.ticks_ms()
-                    logging.info(f"Sent packet: {pkt}")
-
-            await asyncio.sleep(0.1)
+
+    async def transmit_forever(self):
+        """
+        Send queued packets, sleeping until the airtime budget covers the next one rather than polling for it.
+        The next packet stays queued until it's actually sent, so a system packet queued while it waits for airtime or
+        for the channel still goes first, and it keeps counting against its app's queue.
+        """
+        while True:
+            pkt = self._transmit_queue.peek()
+            if pkt is None:
+                await self._tx_ready.wait()
+                continue
+            self.logger.debug(f"Transmit queue size: {len(self._transmit_queue)}")
+            if self.airtime.time_on_air(PACKET_HEADER_SIZE + len(pkt.data)) > self.airtime.capacity_us:
+                # the budget never saves up enough for it, waiting would hold up every packet behind it forever
+                self._transmit_queue.pop(pkt)
+                self.logger.error(f"Packet can never fit the airtime budget, dropped: {pkt}")
+                self._complete(pkt, False)
+                continue
+            delay = self.airtime.delay_ms(PACKET_HEADER_SIZE + len(pkt.data))
+            if delay > 0:
+                await asyncio.sleep_ms(delay)
+                continue  # choose again, the line may have changed meanwhile
+            if not await self._wait_for_channel():
+                if self._transmit_queue.pop(pkt) is not None:
+                    self.logger.warning(f"Channel busy, gave up on packet: {pkt}")
+                    self._complete(pkt, False)
+                continue
+            if self._transmit_queue.pop(pkt) is None:
+                # a system packet jumped the line during the backoff, it gets its own channel check
+                sx.startReceive()
+                continue
+            self.logger.debug(f"Sending packet: {pkt}")
+            state = self._send_msg(pkt.dest.to_bytes(2, 'big'), pkt.app_number.to_bytes(2, 'big'), pkt.data)
+            if state == ERR_NONE:
+                self.logger.info(f"Sent packet: {pkt}")
+            else:
+                self.logger.warning(f"Radio refused packet ({ERROR.get(state, state)}): {pkt}")
+                sx.startReceive()
+            self._complete(pkt, state == ERR_NONE)
+
+    async def _channel_free(self) -> bool:
+        """
+        Run channel activity detection, and go back to receiving if the channel is busy.
+        Not the driver's scanChannel(): it busy-waits on DIO1 with no timeout, with the radio callback still attached
+        to it. Here the callback is detached while CAD runs, and the wait is bounded and lets the other OS tasks run.
+        """
+        self.lbt.checks += 1
+        cad = SX126X_IRQ_CAD_DETECTED | SX126X_IRQ_CAD_DONE
+        sx.clearDio1Action()
+        try:
+            sx.standby()
+            sx.setDioIrqParams(cad, cad)
+            sx.clearIrqStatus()
+            sx.setCad()
+            deadline = time.ticks_add(time.ticks_ms(), CAD_TIMEOUT_MS)
+            while not sx.irq.value() and time.ticks_diff(deadline, time.ticks_ms()) > 0:
+                await asyncio.sleep_ms(1)
+            events = sx.getIrqStatus()
+            sx.clearIrqStatus()
+        finally:
+            sx.setDio1Action(sx._onIRQ)
+        if not events & cad:
+            # better to risk a collision than to stop sending
+            self.logger.warning(f"Channel activity detection timed out after {CAD_TIMEOUT_MS} ms")
+            sx.standby()
+            return True
+        free = not events & SX126X_IRQ_CAD_DETECTED
+        if not free:
+            # CAD leaves the radio in standby, and we won't transmit
+            sx.startReceive()
+        return free
+
+    async def _wait_for_channel(self) -> bool:
+        """
+        Listen before talk: check that nobody else is transmitting, backing off for a random, growing time while the
+        channel is busy. If the channel is free, the radio is left in standby, ready to transmit.
+        :return: Whether the channel is free, False if it was still busy after the last attempt.
+        """
+        # CAD would abort our own previous packet
+        wait = time.ticks_diff(self._tx_end, time.ticks_ms())
+        if wait > 0:
+            await asyncio.sleep_ms(wait)
+        lbt = self.lbt
+        for attempt in range(lbt.max_attempts):
+            if attempt:
+                lbt.retries += 1
+            if await self._channel_free():
+                return True
+            lbt.busy += 1
+            if attempt + 1 < lbt.max_attempts:
+                await asyncio.sleep_ms(lbt.backoff_ms(attempt))
+        lbt.gave_up += 1
+        return False
+
+    def _complete(self, pkt: Packet, sent: bool) -> None:
+        """
+        Record that a packet is done, for report_sent to call its completion callback, if it has one.
+        App code never runs here: a callback that raised or blocked would stall transmit_forever.
+        """
+        if pkt.on_sent is None:
+            return
+        pkt.sent = sent
+        if len(self._sent_queue) == self._sent_queue.capacity:
+            self.logger.warning("Completion queue full, on_sent won't be called for the oldest packet")
+        self._sent_queue.push(pkt)
+
+    def report_sent(self) -> None:
+        """
+        Call the completion callbacks of the packets sent since the last call. Runs on the app thread, which is the
+        only consumer of the completion queue.
+        """
+        pkt = self._sent_queue.pop()
+        while pkt is not None:
+            try:
+                pkt.on_sent(pkt, pkt.sent)
+            except Exception as e:
+                self.logger.exception(e, f"Error in completion callback of {pkt}:")
+            pkt = self._sent_queue.pop()
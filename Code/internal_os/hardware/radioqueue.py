@@ -0,0 +1,272 @@
+""" Fixed-capacity packet queues and the transmit scheduler for the radio """
+import _thread
+
+try:
+    from typing import Any, Callable, Dict, Optional
+except ImportError:
+    # we're on an MCU, typing is not available
+    pass
+
+# What push() does when the queue is full
+DROP_OLDEST = const(0)  # evict the oldest packet to make room
+DROP_NEWEST = const(1)  # refuse the new packet
+
+# Transmit priority classes
+PRIORITY_NORMAL = const(0)  # app traffic, shared fairly between apps
+PRIORITY_SYSTEM = const(1)  # OS traffic such as announcements or acks, sent before any app traffic
+
+class RingBuffer:
+    """
+    A FIFO of at most `capacity` items, allocated once so queueing a packet never allocates.
+    Items can be tagged with a key (the app number) to cap how many items a single key may hold at once; the count is
+    worked out by scanning the keys of the queued items, so keys that come off the air don't grow any table.
+
+    There must be a single producer and a single consumer at any one time: the producer only writes `tail`
+    and the consumer only writes `head`, so a soft IRQ pushing in the middle of a pop() can't corrupt the queue.
+    With DROP_OLDEST the producer overwrites the oldest slot and the consumer skips past it on its next pop.
+    """
+    def __init__(self, capacity: int, policy: int = DROP_OLDEST, quota: int = 0) -> None:
+        """
+        :param capacity: Maximum number of items.
+        :param policy: DROP_OLDEST or DROP_NEWEST, what to do when the queue is full.
+        :param quota: Maximum number of items per key, 0 for no limit. Items over quota are refused whatever the policy.
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.quota = quota
+        self.slots = [None] * capacity
+        self.keys = [0] * capacity
+        self.head = 0  # position of the oldest item, only written by the consumer
+        self.tail = 0  # position of the next free slot, only written by the producer
+        self.enqueued = 0
+        self.dropped = 0
+        self.high_water = 0
+
+    def __len__(self) -> int:
+        return min(self.tail - self.head, self.capacity)
+
+    def count(self, key: int) -> int:
+        """Get the number of queued items with the given key."""
+        capacity = self.capacity
+        keys = self.keys
+        tail = self.tail
+        head = max(self.head, tail - capacity)
+        n = 0
+        for i in range(head, tail):
+            if keys[i % capacity] == key:
+                n += 1
+        return n
+
+    def can_push(self, key: int = 0) -> bool:
+        """Check that push() would queue an item with the given key without dropping anything."""
+        if self.quota and self.count(key) >= self.quota:
+            return False
+        return len(self) < self.capacity
+
+    def push(self, item: Any, key: int = 0) -> bool:
+        """
+        Add an item at the end of the queue. Producer side.
+        :param item: The item to queue, must not be None.
+        :param key: Key the quota is counted against, e.g. the app number.
+        :return: Whether the item was queued. With DROP_OLDEST, a full queue still queues the item, dropping the oldest.
+        """
+        if self.quota and self.count(key) >= self.quota:
+            self.dropped += 1
+            return False
+        tail = self.tail
+        capacity = self.capacity
+        i = tail % capacity
+        if tail - self.head >= capacity:
+            if self.policy == DROP_NEWEST:
+                self.dropped += 1
+                return False
+            self.dropped += 1
+        self.slots[i] = item
+        self.keys[i] = key
+        self.tail = tail + 1  # publish the item only once it's in its slot
+        self.enqueued += 1
+        used = len(self)
+        if used > self.high_water:
+            self.high_water = used
+        return True
+
+    def peek(self) -> Optional[Any]:
+        """
+        Get the oldest item without removing it. Consumer side.
+        :return: The item, or None if the queue is empty.
+        """
+        head = self.head
+        tail = self.tail
+        if head == tail:
+            return None
+        if tail - head > self.capacity:
+            head = tail - self.capacity
+        return self.slots[head % self.capacity]
+
+    def pop(self) -> Optional[Any]:
+        """
+        Remove and return the oldest item. Consumer side.
+        :return: The item, or None if the queue is empty.
+        """
+        capacity = self.capacity
+        while True:
+            head = self.head
+            tail = self.tail
+            if head == tail:
+                return None
+            if tail - head > capacity:
+                head = tail - capacity  # the producer overwrote the oldest items
+            i = head % capacity
+            item = self.slots[i]
+            if self.tail - head <= capacity:  # otherwise the slot was overwritten while we read it, try again
+                self.head = head + 1
+                return item
+
+    def stats(self) -> Dict[str, int]:
+        """Get the queue's length and counters."""
+        return {
+            "capacity": self.capacity,
+            "length": len(self),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "high_water": self.high_water,
+        }
+
+class TxScheduler:
+    """
+    Decides which queued packet the radio sends next.
+    System packets go first. App packets wait in one queue per app, and apps take turns with deficit round-robin:
+    every turn an app earns `quantum` of credit and sends packets for as long as its credit covers their cost (their
+    time on air), so each app gets the same share of the radio however many packets it queues, and none can starve
+    the others.
+    Packets are pushed from any thread and popped by the OS thread, so everything is done under a lock.
+    """
+    def __init__(self, app_queue_size: int, system_queue_size: int, cost: Callable, quantum: int) -> None:
+        """
+        :param app_queue_size: Number of packets each app can have waiting.
+        :param system_queue_size: Number of system packets that can be waiting.
+        :param cost: Function giving the cost of a packet, counted against its app's credit.
+        :param quantum: Credit an app earns per turn. At least the cost of the biggest packet, so every turn sends.
+        """
+        self.app_queue_size = app_queue_size
+        self.quantum = quantum
+        self.cost = cost
+        self.system = RingBuffer(system_queue_size, DROP_NEWEST)
+        self.queues = {}  # app number -> RingBuffer, created the first time the app sends
+        self.deficits = {}  # app number -> credit left this turn
+        self.active = []  # app numbers with packets waiting, in turn order
+        self.turn = 0  # index in active of the app whose turn it is
+        self.credited = False  # whether the app whose turn it is was credited for this turn
+        self.lock = _thread.allocate_lock()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.system) + sum(len(queue) for queue in self.queues.values())
+
+    def _queue(self, app_number: int) -> RingBuffer:
+        queue = self.queues.get(app_number)
+        if queue is None:
+            queue = RingBuffer(self.app_queue_size, DROP_NEWEST)
+            self.queues[app_number] = queue
+            self.deficits[app_number] = 0
+        return queue
+
+    def count(self, app_number: int) -> int:
+        """Get the number of packets an app has waiting."""
+        queue = self.queues.get(app_number)
+        return len(queue) if queue is not None else 0
+
+    def can_push(self, app_number: int, priority: int = PRIORITY_NORMAL) -> bool:
+        """Check that push() would accept a packet."""
+        if priority == PRIORITY_SYSTEM:
+            return self.system.can_push()
+        queue = self.queues.get(app_number)
+        return queue is None or queue.can_push()
+
+    def push(self, packet: Any, priority: int = PRIORITY_NORMAL) -> bool:
+        """
+        Queue a packet.
+        :param packet: The packet, queued against its app_number.
+        :param priority: PRIORITY_NORMAL or PRIORITY_SYSTEM.
+        :return: Whether the packet was queued, False if its queue is full.
+        """
+        with self.lock:
+            if priority == PRIORITY_SYSTEM:
+                return self.system.push(packet)
+            app_number = packet.app_number
+            queue = self._queue(app_number)
+            if not queue.push(packet):
+                return False
+            if app_number not in self.active:
+                self.active.append(app_number)
+            return True
+
+    def _next(self) -> Optional[RingBuffer]:
+        """
+        Find the queue whose oldest packet is to be sent next, crediting apps as their turns come. Must hold the lock.
+        Calling it again without popping finds the same queue, unless packets were pushed meanwhile.
+        """
+        if len(self.system):
+            return self.system
+        active = self.active
+        while active:
+            if self.turn >= len(active):
+                self.turn = 0
+            app_number = active[self.turn]
+            if not self.credited:
+                self.deficits[app_number] += self.quantum
+                self.credited = True
+            queue = self.queues[app_number]
+            if self.cost(queue.peek()) <= self.deficits[app_number]:
+                return queue
+            # not enough credit left, it's the next app's turn
+            self.turn += 1
+            self.credited = False
+        return None
+
+    def peek(self) -> Optional[Any]:
+        """
+        Get the packet to send next, leaving it queued so that it still counts against its app's queue and a system
+        packet pushed meanwhile can still go first.
+        :return: The packet, or None if nothing is waiting.
+        """
+        with self.lock:
+            queue = self._next()
+            return queue.peek() if queue is not None else None
+
+    def pop(self, packet: Optional[Any] = None) -> Optional[Any]:
+        """
+        Remove and return the packet to send next.
+        :param packet: If given, only remove the next packet if it's this one, as returned by peek().
+        :return: The packet, or None if nothing is waiting or the next packet isn't `packet`.
+        """
+        with self.lock:
+            queue = self._next()
+            if queue is None:
+                return None
+            next_packet = queue.peek()
+            if packet is not None and next_packet is not packet:
+                return None
+            queue.pop()
+            if queue is self.system:
+                return next_packet
+            app_number = next_packet.app_number
+            self.deficits[app_number] -= self.cost(next_packet)
+            if not len(queue):
+                # an app doesn't keep credit while it has nothing to send
+                self.deficits[app_number] = 0
+                self.active.pop(self.turn)
+                self.credited = False
+            return next_packet
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the counters of the system queue and of every app's queue."""
+        with self.lock:
+            return {
+                "system": self.system.stats(),
+                "apps": {app_number: queue.stats() for app_number, queue in self.queues.items()},
+            }
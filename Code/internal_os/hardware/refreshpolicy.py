@@ -0,0 +1,131 @@
+"""
+Decides when the e-ink panel needs a full refresh.
+Partial refreshes leave a little ghosting behind on every pixel they flip, so instead of doing a
+full refresh every N frames, the policy keeps a ghosting budget: it counts how many pixels were
+flipped by partial refreshes in each tile of the screen since the last full refresh, and asks for
+a full refresh once one tile has taken too much damage.
+The budget decays while damage sits on the panel: it halves every half_life_ms since the first
+partial refresh, so heavy damage is cleaned up within minutes while a few flipped pixels on an
+otherwise idle panel don't cost a 2 s full refresh until much later.
+"""
+import micropython
+import utime
+from array import array
+
+try:
+    from typing import Optional
+except ImportError:
+    # we're on an MCU, typing is not available
+    pass
+
+@micropython.viper
+def _count_flips(cur: ptr8, prev: ptr8, stride: int, x0: int, x1: int, y0: int, y1: int, tile_w: int, tile_h: int, tiles_x: int, counts: ptr32) -> int:
+    """
+    Add the number of pixels that differ between two MONO_HLSB buffers, in byte columns x0..x1-1 of rows y0..y1-1,
+    to the per-tile counters.
+    Tiles are tile_w bytes wide and tile_h rows high, counted row-major with tiles_x tiles per row.
+    Returns the total number of flipped pixels.
+    """
+    total = 0
+    y = y0
+    while y < y1:
+        base = y * stride
+        tile = (y // tile_h) * tiles_x + x0 // tile_w
+        tx = x0 % tile_w
+        x = x0
+        while x < x1:
+            d = cur[base + x] ^ prev[base + x]
+            if d:
+                d = d - ((d >> 1) & 0x55)
+                d = (d & 0x33) + ((d >> 2) & 0x33)
+                d = (d + (d >> 4)) & 0x0F
+                counts[tile] += d
+                total += d
+            x += 1
+            tx += 1
+            if tx == tile_w:
+                tx = 0
+                tile += 1
+        y += 1
+    return total
+
+class RefreshPolicy:
+    """
+    Ghosting budget for the e-ink panel.
+    Call add_damage() with each frame about to be partially refreshed, then needs_full() to find out
+    whether to use the full waveform instead, and record_partial()/record_full() once it's been sent.
+    """
+    def __init__(self, width: int, height: int, tile_size: int = 40, threshold: Optional[int] = None, half_life_ms: int = 300_000) -> None:
+        """
+        :param width: Width of the framebuffer in pixels (multiple of 8).
+        :param height: Height of the framebuffer in pixels.
+        :param tile_size: Side of the square tiles damage is tracked in, in pixels (multiple of 8).
+        :param threshold: Flipped pixels a single tile can take before a full refresh is needed. Defaults to the tile's area.
+        :param half_life_ms: Time after which the threshold is halved, again and again, while damage is on the panel.
+        """
+        self.stride = width // 8
+        self.height = height
+        self.tile_w = tile_size // 8
+        self.tile_h = tile_size
+        self.tiles_x = (self.stride + self.tile_w - 1) // self.tile_w
+        self.tiles_y = (height + tile_size - 1) // tile_size
+        self.threshold = threshold if threshold is not None else tile_size * tile_size
+        self.half_life_ms = half_life_ms
+        self.damage = array('I', [0] * (self.tiles_x * self.tiles_y))
+        self.damaged_since = None  # ticks_ms of the first partial refresh since the last full one
+
+        self.full_refreshes = 0
+        self.partial_refreshes = 0
+        self.avoided_full_refreshes = 0  # full refreshes the old every-8th-frame rule would have done
+        self.partials_since_full = 0
+
+    def add_damage(self, buffer, shadow, rects=None) -> int:
+        """
+        Count the pixels a partial refresh of buffer would flip.
+        :param buffer: The framebuffer about to be pushed.
+        :param shadow: What the panel currently shows (DirtyTracker.shadow).
+        :param rects: The (x, y, w, h) windows that are about to be sent, from DirtyTracker.diff; nothing outside them
+                      changed, so only they are scanned. None scans the whole buffer.
+        :return: The number of flipped pixels.
+        """
+        if rects is None:
+            flips = _count_flips(buffer, shadow, self.stride, 0, self.stride, 0, self.height, self.tile_w, self.tile_h, self.tiles_x, self.damage)
+        else:
+            flips = 0
+            for x, y, w, h in rects:
+                flips += _count_flips(buffer, shadow, self.stride, x >> 3, (x + w) >> 3, y, min(y + h, self.height), self.tile_w, self.tile_h, self.tiles_x, self.damage)
+        if flips and self.damaged_since is None:
+            self.damaged_since = utime.ticks_ms()
+        return flips
+
+    def needs_full(self) -> bool:
+        """Whether the accumulated damage calls for a full refresh."""
+        if self.damaged_since is None:
+            return False
+        halvings = min(utime.ticks_diff(utime.ticks_ms(), self.damaged_since) // self.half_life_ms, 16)
+        return max(self.damage) << halvings >= self.threshold
+
+    def record_partial(self) -> None:
+        """Record that a partial refresh was done."""
+        self.partial_refreshes += 1
+        self.partials_since_full += 1
+        if self.partials_since_full % 8 == 0:
+            self.avoided_full_refreshes += 1
+
+    def record_full(self) -> None:
+        """Record that a full refresh was done, which clears all ghosting."""
+        self.full_refreshes += 1
+        self.partials_since_full = 0
+        self.damaged_since = None
+        for i in range(len(self.damage)):
+            self.damage[i] = 0
+
+    def get_stats(self) -> dict:
+        """Get the refresh counters and the worst tile's damage."""
+        return {
+            "full_refreshes": self.full_refreshes,
+            "partial_refreshes": self.partial_refreshes,
+            "avoided_full_refreshes": self.avoided_full_refreshes,
+            "max_damage": max(self.damage),
+            "threshold": self.threshold,
+        }
@@ -0,0 +1,157 @@
+import framebuf
+import struct
+import os
+import logging
+import internal_os.assets as assets
+import assetio
+
+try:
+    from typing import List, Optional, Tuple
+except ImportError:
+    # we're on an MCU, typing is not available
+    pass
+
+ICON_SIZE = 48
+ICON_BYTES = ICON_SIZE // 8 * ICON_SIZE
+ICONATLAS_MAGIC = b"ICA1"
+# per entry: app path length, manifest size, manifest mtime, logo size, logo mtime
+ICONATLAS_ENTRY = "<BIIII"
+
+def _signature(app: "AppRepr") -> Tuple[int, int, int, int]:
+    """Sizes and modification times of an app's manifest and logo, to tell when its icon has to be rebuilt."""
+    signature = []
+    for path in (app.app_path + "/manifest.json", app.logo_path):
+        try:
+            stat = os.stat(path)
+            signature += [stat[6], stat[8]]
+        except (OSError, TypeError):
+            signature += [0, 0]
+    return tuple(signature)
+
+class IconAtlas:
+    """
+    The 48x48 icons of all registered apps, packed one under the other in a single 1-bit bitmap.
+    Icons are keyed by app path. The atlas is rebuilt when an app is added or removed, or its manifest or logo changes,
+    and saved to flash, so the home screen can draw icons without any file I/O.
+    """
+    def __init__(self, path: str = "/data/.iconatlas") -> None:
+        """
+        :param path: File the atlas is saved to and loaded from.
+        """
+        self.logger = logging.getLogger("IconAtlas")
+        self.logger.setLevel(logging.INFO)
+        self.path = path
+        # (app path -> (slot, signature), bitmap), replaced as a whole so the app thread always sees a consistent atlas
+        self.state = ({}, bytearray(0))
+        self.views = {}  # slot -> FrameBuffer over the bitmap, for the current state
+        self.rebuilds = 0
+        self.load()
+
+    def get(self, app_path: str) -> Optional[framebuf.FrameBuffer]:
+        """
+        Get the icon of an app.
+        :param app_path: Path of the app, e.g. "/apps/badge".
+        :return: A 48x48 FrameBuffer over the atlas, or None if the app has no icon in it.
+        """
+        slots, bitmap = self.state
+        entry = slots.get(app_path)
+        if entry is None:
+            return None
+        slot = entry[0]
+        views = self.views
+        view = views.get(slot)
+        if view is None or view[0] is not bitmap:
+            view = (bitmap, framebuf.FrameBuffer(memoryview(bitmap)[slot * ICON_BYTES:(slot + 1) * ICON_BYTES], ICON_SIZE, ICON_SIZE, framebuf.MONO_HLSB))
+            views[slot] = view
+        return view[1]
+
+    def update(self, apps: List["AppRepr"]) -> bool:
+        """
+        Rebuild the atlas if the set of apps or any of their manifests or logos changed, and save it.
+        Icons of unchanged apps are copied over from the old atlas rather than loaded again.
+        :param apps: The registered apps.
+        :return: Whether the atlas was rebuilt.
+        """
+        old_slots, old_bitmap = self.state
+        signatures = {app.app_path: _signature(app) for app in apps}
+        if len(signatures) == len(old_slots) and all(path in old_slots and old_slots[path][1] == signature for path, signature in signatures.items()):
+            return False
+
+        slots = {}
+        bitmap = bytearray(len(apps) * ICON_BYTES)
+        for slot, app in enumerate(apps):
+            signature = signatures[app.app_path]
+            slots[app.app_path] = (slot, signature)
+            dest = memoryview(bitmap)[slot * ICON_BYTES:(slot + 1) * ICON_BYTES]
+            old = old_slots.get(app.app_path)
+            if old is not None and old[1] == signature:
+                dest[:] = memoryview(old_bitmap)[old[0] * ICON_BYTES:(old[0] + 1) * ICON_BYTES]
+            else:
+                self._render_icon(app, dest)
+        self.state = (slots, bitmap)
+        self.views = {}
+        self.rebuilds += 1
+        self.logger.info(f"Rebuilt icon atlas with {len(apps)} icons")
+        self.save()
+        return True
+
+    def _render_icon(self, app: "AppRepr", dest: memoryview) -> None:
+        """Draw an app's logo centered in a white 48x48 slot, falling back to the missing texture."""
+        icon = framebuf.FrameBuffer(dest, ICON_SIZE, ICON_SIZE, framebuf.MONO_HLSB)
+        icon.fill(1)
+        # the logo is only needed until it's blitted, so it's loaded into scratch memory
+        arena = assetio.scratch()
+        for path in (app.logo_path, "/missingtex.pbm"):
+            mark = arena.mark()
+            try:
+                logo, width, height = assets.load_image(path, arena)
+                icon.blit(logo, (ICON_SIZE - width) // 2, (ICON_SIZE - height) // 2)
+                return
+            except (OSError, ValueError, TypeError) as e:
+                self.logger.warning(f"Failed to load icon {path} for {app.app_path}: {e}")
+            finally:
+                arena.release(mark)
+
+    def save(self) -> None:
+        """Save the atlas to flash."""
+        slots, bitmap = self.state
+        try:
+            with open(self.path, "wb") as f:
+                f.write(ICONATLAS_MAGIC)
+                f.write(struct.pack("<H", len(slots)))
+                # entries are written in slot order, so the bitmap can be read back in one go
+                for app_path, (_, signature) in sorted(slots.items(), key=lambda item: item[1][0]):
+                    app_path = app_path.encode()
+                    f.write(struct.pack(ICONATLAS_ENTRY, len(app_path), *signature))
+                    f.write(app_path)
+                f.write(bitmap)
+        except OSError as e:
+            self.logger.error(f"Failed to save icon atlas to {self.path}: {e}")
+
+    def load(self) -> None:
+        """Load the atlas saved by save(), if there is one."""
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return
+        try:
+            if f.read(len(ICONATLAS_MAGIC)) != ICONATLAS_MAGIC:
+                raise ValueError("not an icon atlas")
+            count = struct.unpack("<H", f.read(2))[0]
+            slots = {}
+            entry = bytearray(struct.calcsize(ICONATLAS_ENTRY))
+            for slot in range(count):
+                if f.readinto(entry) != len(entry):
+                    raise ValueError("truncated entry")
+                path_len, *signature = struct.unpack(ICONATLAS_ENTRY, entry)
+                slots[f.read(path_len).decode()] = (slot, tuple(signature))
+            bitmap = bytearray(count * ICON_BYTES)
+            if f.readinto(bitmap) != len(bitmap):
+                raise ValueError("truncated bitmap")
+            self.state = (slots, bitmap)
+            self.views = {}
+        except (OSError, ValueError) as e:
+            # a stale or corrupted atlas is simply rebuilt
+            self.logger.error(f"Failed to load icon atlas from {self.path}: {e}")
+        finally:
+            f.close()
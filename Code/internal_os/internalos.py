@@ -13,6 +13,7 @@ from internal_os.hardware.utils import BadgeUtils, unique_id
 from internal_os.contacts import ContactsManager
 from internal_os.notifs import NotifManager
 from internal_os.apps import AppManager
+import assetio
 
 import logging
 
@@ -54,6 +55,8 @@ class InternalOS:
         # 3. Start the asyncio event loop.
 
         # Step 1:
+        # scratch memory for reading assets, before anything fragments the heap
+        assetio.scratch()
         # hardware
         self.display = BadgeDisplay()
         self.radio = BadgeRadio(self)
@@ -63,6 +66,7 @@ class InternalOS:
         self.utils = BadgeUtils()
         self.uart = BadgeUART()
 
+        # blocking is fine here: flush_forever isn't scheduled yet, and nothing else can drive the panel
         self.display.fill(1)
         self.display.show(full=True)
 
@@ -70,14 +74,13 @@ class InternalOS:
         gc.enable()
         self.contacts = ContactsManager(self)
         self.notifs = NotifManager()
-        self.apps = AppManager(self.buttons, self.display)
-
-        self.display_refresh_count = 0 # used to occasionally force a full refresh
+        self.apps = AppManager(self.buttons, self.display, self.radio)
 
         # Step 2:
         asyncio.create_task(self.apps.scan_forever(interval=15)) # TODO: lower this interval in prod?
         asyncio.create_task(self.apps.home_button_watcher())
         asyncio.create_task(self.display.idle_when_inactive())
+        asyncio.create_task(self.display.flush_forever())
         asyncio.create_task(self.radio.manage_packets_forever())
         asyncio.create_task(self.launch_home_screen())
 
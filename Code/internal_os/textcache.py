@@ -0,0 +1,151 @@
+import framebuf
+import struct
+import os
+import logging
+from lrucache import LRUCache
+
+try:
+    from typing import Tuple
+    from microfont import MicroFont
+except ImportError:
+    # we're on an MCU, typing is not available
+    pass
+
+TEXTCACHE_MAGIC = b"TXC2"
+# per entry: font filename length, text length, x spacing, y spacing, bitmap width, bitmap height,
+# font file size, font file mtime
+ENTRY_HEADER = "<HHhhHHII"
+SPACING_RANGE = (-32768, 32767)  # what fits in the entry header, entries with spacing outside of it aren't saved
+ENTRY_OVERHEAD = 64  # rough size of the FrameBuffer, tuple and key of an entry
+
+class TextCache:
+    """
+    Cache of rendered nice_text strings, as 1-bit masks ready to be blitted.
+    Entries are keyed by (font file, font signature, text, x spacing, y spacing) and evicted least recently used first
+    when the cache goes over its byte budget. The cache can be saved to flash and is loaded back on the next boot;
+    the font signature (size and mtime of the font file) makes entries rendered with an older version of a font miss.
+    Only unrotated text is cached.
+    """
+    def __init__(self, budget: int = 8192, path: str = "/data/.textcache") -> None:
+        """
+        :param budget: Maximum size of the cached bitmaps, in bytes.
+        :param path: File the cache is saved to and loaded from.
+        """
+        self.logger = logging.getLogger("TextCache")
+        self.logger.setLevel(logging.INFO)
+        self.cache = LRUCache(budget)
+        self.path = path
+        self.dirty = False  # whether there are entries that weren't saved yet
+        self.signatures = {}  # font file -> (size, mtime), read once per boot
+        # blit palettes mapping mask pixels (0 = background, 1 = ink) to the text color
+        self.palettes = []
+        for color in (0, 1):
+            palette = framebuf.FrameBuffer(bytearray(1), 2, 1, framebuf.MONO_HLSB)
+            palette.pixel(0, 0, 1 - color)
+            palette.pixel(1, 0, color)
+            self.palettes.append(palette)
+
+    def draw(self, fb: framebuf.FrameBuffer, font: "MicroFont", text: str, x: int, y: int, color: int, x_spacing: int = 0, y_spacing: int = 0) -> None:
+        """
+        Draw text like MicroFont.write, rendering it only if it isn't cached yet.
+        :param fb: FrameBuffer to draw into.
+        :param font: The font to use.
+        :param text: The text to draw.
+        :param x: X coordinate of the text.
+        :param y: Y coordinate of the text.
+        :param color: Color of the text (0=black, 1=white).
+        :param x_spacing: Horizontal spacing between characters.
+        :param y_spacing: Vertical spacing between lines.
+        """
+        key = (font.filename, self.font_signature(font.filename), text, x_spacing, y_spacing)
+        mask = self.cache.get(key)
+        if mask is None:
+            mask, size = self.render(font, text, x_spacing, y_spacing)
+            self.cache.put(key, mask, size + ENTRY_OVERHEAD)
+            self.dirty = True
+        # background pixels map to 1 - color, which is the transparent key
+        fb.blit(mask[0], x, y, 1 - color, self.palettes[color])
+
+    def font_signature(self, font_file: str) -> Tuple[int, int]:
+        """Get the (size, mtime) of a font file, (0, 0) if it can't be read."""
+        signature = self.signatures.get(font_file)
+        if signature is None:
+            try:
+                stat = os.stat(font_file)
+                signature = (stat[6], stat[8])
+            except OSError:
+                signature = (0, 0)
+            self.signatures[font_file] = signature
+        return signature
+
+    def render(self, font: "MicroFont", text: str, x_spacing: int, y_spacing: int) -> Tuple[tuple, int]:
+        """
+        Render text into a new mask.
+        :return: ((FrameBuffer, width, height, buffer), size of the buffer)
+        """
+        width, height = font.measure(text, x_spacing, y_spacing)
+        width = (max(width, 1) + 7) & ~7  # whole bytes, so that MicroFont takes its fast path
+        height = max(height, 1)
+        buf = bytearray(width // 8 * height)
+        mask = framebuf.FrameBuffer(buf, width, height, framebuf.MONO_HLSB)
+        font.write(text, mask, framebuf.MONO_HLSB, width, height, 0, 0, 1, x_spacing=x_spacing, y_spacing=y_spacing)
+        return (mask, width, height, buf), len(buf)
+
+    def save(self) -> None:
+        """Save the cached entries to flash, if there are new ones."""
+        if not self.dirty:
+            return
+        try:
+            with open(self.path, "wb") as f:
+                f.write(TEXTCACHE_MAGIC)
+                low, high = SPACING_RANGE
+                for (font_file, signature, text, x_spacing, y_spacing), (_, width, height, buf) in self.cache.items():
+                    if not (low <= x_spacing <= high and low <= y_spacing <= high):
+                        continue
+                    font_file = font_file.encode()
+                    text = text.encode()
+                    f.write(struct.pack(ENTRY_HEADER, len(font_file), len(text), x_spacing, y_spacing, width, height, *signature))
+                    f.write(font_file)
+                    f.write(text)
+                    f.write(buf)
+        except OSError as e:
+            self.logger.error(f"Failed to save {self.path}: {e}")
+            return
+        self.dirty = False
+        self.logger.info(f"Saved {len(self.cache.entries)} rendered strings to {self.path}")
+
+    def load(self) -> None:
+        """Load entries saved by save(), if there are any."""
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return
+        header = bytearray(struct.calcsize(ENTRY_HEADER))
+        stale = 0
+        try:
+            if f.read(len(TEXTCACHE_MAGIC)) != TEXTCACHE_MAGIC:
+                raise ValueError("not a text cache file")
+            while f.readinto(header) == len(header):
+                font_len, text_len, x_spacing, y_spacing, width, height, font_size, font_mtime = struct.unpack(ENTRY_HEADER, header)
+                font_file = f.read(font_len).decode()
+                text = f.read(text_len).decode()
+                signature = (font_size, font_mtime)
+                if signature != self.font_signature(font_file):
+                    # rendered with another version of the font
+                    f.seek(width // 8 * height, 1)
+                    stale += 1
+                    continue
+                buf = bytearray(width // 8 * height)
+                if f.readinto(buf) != len(buf):
+                    raise ValueError("truncated entry")
+                mask = framebuf.FrameBuffer(buf, width, height, framebuf.MONO_HLSB)
+                self.cache.put((font_file, signature, text, x_spacing, y_spacing), (mask, width, height, buf), len(buf) + ENTRY_OVERHEAD)
+        except (OSError, ValueError) as e:
+            # a stale or corrupted cache only costs re-rendering
+            self.logger.error(f"Failed to load {self.path}: {e}")
+        finally:
+            f.close()
+        if stale:
+            # drop them from flash on the next save
+            self.dirty = True
+        self.logger.info(f"Loaded {len(self.cache.entries)} rendered strings from {self.path} ({stale} stale)")
@@ -0,0 +1,72 @@
+# A size-bounded least-recently-used cache.
+#
+# MicroPython dicts don't keep insertion order, so instead of a linked list
+# every entry remembers the tick of its last use. Lookups just bump the
+# tick; when the byte budget is exceeded, entries are evicted oldest first
+# until the cache is back at 3/4 of its budget, so the (sorting) eviction
+# cost is paid once for a batch of insertions rather than on each of them.
+
+class LRUCache:
+    def __init__(self, budget):
+        self.budget = budget # Total size of the cached values, in bytes.
+        self.entries = {} # key -> [value, last use tick, size]
+        self.tick = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.tick += 1
+        entry[1] = self.tick
+        return entry[0]
+
+    def put(self, key, value, size):
+        if size > self.budget:
+            return
+        old = self.entries.get(key)
+        if old is not None:
+            self.size -= old[2]
+        self.tick += 1
+        self.entries[key] = [value, self.tick, size]
+        self.size += size
+        if self.size > self.budget:
+            self.evict(self.budget * 3 // 4)
+
+    # Evict least recently used entries until the cache holds at most
+    # 'target' bytes.
+    def evict(self, target):
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1][1]):
+            if self.size <= target:
+                break
+            del self.entries[key]
+            self.size -= entry[2]
+            self.evictions += 1
+
+    def set_budget(self, budget):
+        self.budget = budget
+        if self.size > budget:
+            self.evict(budget)
+
+    # Return a list of (key, value) pairs, least recently used first.
+    def items(self):
+        return [(key, entry[0]) for key, entry in sorted(self.entries.items(), key=lambda item: item[1][1])]
+
+    def clear(self):
+        self.entries = {}
+        self.size = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "budget": self.budget,
+        }
@@ -1,4 +1,7 @@
-import struct, framebuf, math
+import struct, framebuf, math, _thread
+from array import array
+from lrucache import LRUCache
+from assetio import scratch
 
 # This is a lookup table for fasth computation of sin() and cos() functions
 # of degrees from 0 to 360. At postion "A" the table stores sin(A)*64+64,
@@ -18,17 +21,74 @@ def fast_sin(angle):
 
 def fast_cos(angle): return fast_sin(angle+90)
 
+# Font files are kept open for lower latency, but every open file costs a
+# handle and a buffer. This keeps at most max_open of them open, closing the
+# least recently used one when another font needs its file. A closed font
+# transparently reopens its file the next time it needs it.
+class FilePool:
+    def __init__(self, max_open=3):
+        self.max_open = max_open
+        self.fonts = [] # Fonts with an open file, least recently used first.
+        self.opens = 0
+        self.evictions = 0
+
+    def file_for(self, font):
+        fonts = self.fonts
+        if font.stream is not None:
+            if fonts[-1] is not font:
+                fonts.remove(font)
+                fonts.append(font)
+            return font.stream
+        while len(fonts) >= self.max_open:
+            fonts.pop(0)._close()
+            self.evictions += 1
+        font.stream = open(font.filename,"rb")
+        fonts.append(font)
+        self.opens += 1
+        return font.stream
+
+    def forget(self, font):
+        if font in self.fonts:
+            self.fonts.remove(font)
+
+file_pool = FilePool()
+
+# Glyphs read from flash are kept in a cache shared by all the fonts, as
+# (bitmap, height, width) tuples keyed by font id and codepoint, so that
+# redrawing the same text doesn't hit the filesystem. The budget counts the
+# bitmap bytes plus a rough per-entry overhead, and can be changed with
+# glyph_cache.set_budget(); glyph_cache.stats() has the hit/miss counters.
+GLYPH_OVERHEAD = const(48)
+glyph_cache = LRUCache(8192)
+
+# file_pool, glyph_cache and the fonts' open files are shared by the OS
+# thread (status bar, compositor) and the app thread, which run on different
+# cores. Everything that touches them holds this lock, so that an eviction on
+# one core can't close a file the other one is reading.
+_lock = _thread.allocate_lock()
+
 class MicroFont:
-    def __init__(self,filename,cache_index = False, cache_chars = False):
-        print(f"Loading MicroFont from {filename}")
-        stream = open(filename,"rb")
-        header_data = stream.read(12)
-        if len(header_data) != 12:
-            raise ValueError("Corrupted header for MFNT font file")
-        magic,height,baseline,max_width,monospaced,index_len = \
-            struct.unpack("<4sBBBBL",header_data)
-        if magic != b'MFNT':
-            raise ValueError(f"{filename} is not a MicroFont file")
+    next_id = 0
+    # If 'header' is given, as the (height, baseline, max_width, monospaced,
+    # index_len) fields of the file header, the file is not opened until the
+    # first glyph is needed, so metrics can be used for free.
+    def __init__(self,filename,cache_index = False, cache_chars = False, header = None):
+        self.filename = filename
+        self.stream = None
+        self.font_id = MicroFont.next_id # Used to key the glyph cache without allocating.
+        MicroFont.next_id += 1
+        if header is None:
+            print(f"Loading MicroFont from {filename}")
+            with _lock:
+                header_data = file_pool.file_for(self).read(12)
+            if len(header_data) != 12:
+                raise ValueError("Corrupted header for MFNT font file")
+            magic,height,baseline,max_width,monospaced,index_len = \
+                struct.unpack("<4sBBBBL",header_data)
+            if magic != b'MFNT':
+                raise ValueError(f"{filename} is not a MicroFont file")
+        else:
+            height,baseline,max_width,monospaced,index_len = header
         self.height = height
         self.baseline = baseline
         self.max_width = max_width
@@ -37,12 +97,60 @@ class MicroFont:
         self.cache_chars = cache_chars
         self.cache_index = cache_index or cache_chars
         self.index = None
+        self.ascii_offsets = None # Data offsets of printable ASCII glyphs, built from the index on first use.
         self.cache = {}
-        self.stream = stream # We keep the file open for lower latecy.
+        self.advances = {} # Character -> advance width, filled by advance().
+
+    # Close the font file. It is reopened when needed.
+    def close(self):
+        with _lock:
+            self._close()
+
+    def _close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        file_pool.forget(self)
 
     def read_int_16(self,l):
         return l[0] | (l[1] << 8)
 
+    # Return the sparse index (cached if cache_index is set), or None if
+    # it couldn't be read in full. An uncached index is borrowed from
+    # 'arena', so it must not be kept after the arena is released.
+    def read_index(self, arena):
+        if self.index != None:
+            return self.index
+        stream = file_pool.file_for(self)
+        stream.seek(12) # The index follows the header.
+        try:
+            if self.cache_index:
+                index = bytearray(self.index_len)
+                if stream.readinto(index) != self.index_len:
+                    return None
+                self.index = index
+            else:
+                index = arena.read(stream, self.index_len)
+                if len(index) != self.index_len:
+                    return None
+        except OSError:
+            return None
+        return index
+
+    # Build a dense table of the data offsets of the printable ASCII
+    # characters (32-126), so that looking them up needs neither a binary
+    # search nor the index. Characters missing from the font get offset 0,
+    # like a failed binary search.
+    def build_ascii_offsets(self, index):
+        offsets = array('H', [0]*95)
+        for i in range(0, len(index) & ~3, 4):
+            code = index[i] | index[i+1] << 8
+            if code >= 127:
+                break # The index is sorted.
+            if code >= 32:
+                offsets[code-32] = index[i+2] | index[i+3] << 8
+        return offsets
+
     # Binary search of the sparse index.
     def bs(self, index, val):
         while True:
@@ -54,41 +162,125 @@ class MicroFont:
                 return 0
             index = index[m:] if v < val else index[:m]
 
+    # Return the offset of the character data inside the file, relative
+    # to the start of the data section, so the real offset from the start
+    # is hdr_len + index_len + doff. Printable ASCII is looked up directly,
+    # the rest goes through a binary search of the sparse index.
+    # Returns None if the index couldn't be read.
+    def data_offset(self, code):
+        if 32 <= code < 127 and self.ascii_offsets is not None:
+            return self.ascii_offsets[code-32] << 3
+        arena = scratch()
+        mark = arena.mark()
+        try:
+            index = self.read_index(arena)
+            if index is None:
+                return None
+            if self.ascii_offsets is None:
+                self.ascii_offsets = self.build_ascii_offsets(index)
+            if 32 <= code < 127:
+                return self.ascii_offsets[code-32] << 3
+            return self.bs(memoryview(index), code) << 3
+        finally:
+            arena.release(mark)
+
+    # Seek to the character data at 'doff' and read the glyph width in
+    # front of it, leaving the stream at the start of the bitmap. Returns
+    # None if the file ends before the width.
+    def read_width(self, stream, doff):
+        stream.seek(12+self.index_len+doff) # 12 is header len.
+        arena = scratch()
+        mark = arena.mark()
+        data = arena.read(stream, 2)
+        width = self.read_int_16(data) if len(data) == 2 else None
+        arena.release(mark)
+        return width
+
+    # An empty character of the maximum width, returned when a glyph can't
+    # be read.
+    def blank_ch(self):
+        # the weird math below is to return the correct length of 0s that a char would have - divide width by 8, rounding up, and multiply that by height
+        return (b'\x00'*(self.height*(-(self.max_width//-8)))), self.height, self.max_width
+
     # Return the character bitmap (horizontally mapped, and horizontally
     # padded to whole bytes), the height and width in pixels.
     def get_ch(self, ch):
         if self.cache_chars and ch in self.cache:
             return self.cache[ch]
+        with _lock:
+            return self._load_ch(ch)
 
-        # Read the index in memory, if not cached.
-        if self.index != None:
-            index = self.index
-        else:
-            self.stream.seek(0)
-            try:
-                index = self.stream.read(self.index_len)
-            except OSError:
-                # this is OSerror 84 - no idea what causes it
-                # just return an empty char and move on
-                print(f"ERROR:MicroFont:OSError while trying to read index for char {ch}")
-                # the weird math below is to return the correct length of 0s that a char would have - divide width by 8, rounding up, and multiply that by height
-                return (b'\x00'*(self.height*(-(self.max_width//-8)))), self.height, self.max_width
-            if self.cache_index: self.index = index
-
-        # Get the character data offset inside the file
-        # relative to the start of the data section, so the
-        # real offset from the start is hdr_len + index_len + doff.
-        doff = self.bs(memoryview(index), ord(ch)) << 3
+    def _load_ch(self, ch):
+        code = ord(ch)
+        key = (self.font_id << 21) | code
+        retval = glyph_cache.get(key)
+        if retval is not None:
+            return retval
+
+        doff = self.data_offset(code)
+        if doff is None:
+            # this is OSerror 84 - no idea what causes it
+            # just return an empty char and move on
+            print(f"ERROR:MicroFont:OSError while trying to read index for char {ch}")
+            return self.blank_ch()
 
         # Access the char data inside the file and return it.
-        self.stream.seek(12+self.index_len+doff) # 12 is header len.
-        width = self.read_int_16(self.stream.read(2))
-        char_data_len = (width + 7)//8 * self.height
-        char_data = self.stream.read(char_data_len)
+        stream = file_pool.file_for(self)
+        width = self.read_width(stream, doff)
+        if width is None:
+            print(f"ERROR:MicroFont:{self.filename} is truncated at char {ch}")
+            return self.blank_ch()
+        char_data = bytearray((width + 7)//8 * self.height)
+        if stream.readinto(char_data) != len(char_data):
+            # don't cache it, the file may be rewritten
+            print(f"ERROR:MicroFont:{self.filename} is truncated at char {ch}")
+            return self.blank_ch()
+        self.advances[ch] = width
         retval = char_data, self.height, width
-        if self.cache_chars: self.cache[ch] = retval
+        if self.cache_chars:
+            self.cache[ch] = retval
+        else:
+            glyph_cache.put(key, retval, len(char_data) + GLYPH_OVERHEAD)
         return retval
 
+    # Return the advance width of a character in pixels. Widths are kept
+    # forever once known (they are tiny, unlike the bitmaps), and reading
+    # one only needs the two width bytes in front of the glyph bitmap.
+    def advance(self, ch):
+        width = self.advances.get(ch)
+        if width is not None:
+            return width
+        with _lock:
+            return self._read_advance(ch)
+
+    def _read_advance(self, ch):
+        doff = self.data_offset(ord(ch))
+        if doff is None:
+            return self.max_width
+        width = self.read_width(file_pool.file_for(self), doff)
+        if width is None:
+            return self.max_width
+        self.advances[ch] = width
+        return width
+
+    # Return the (width, height) in pixels that write() would cover when
+    # drawing 'txt' unrotated, without drawing (or loading) any glyph.
+    def measure(self, txt, x_spacing=0, y_spacing=0):
+        width = 0
+        line_width = 0
+        lines = 1
+        for c in txt:
+            if c == '\n':
+                width = max(width, line_width)
+                line_width = 0
+                lines += 1
+                continue
+            if line_width:
+                line_width += x_spacing
+            line_width += self.advance(c)
+        width = max(width, line_width)
+        return width, lines*self.height + (lines-1)*y_spacing
+
     # Lowlevel framebuffer function. That's the core of the library, as handles
     # the actual drawing of the character to the target framebuffer memory
     # with rotation, oversampling and so forth.
@@ -128,6 +320,55 @@ class MicroFont:
                         fb16 = ptr16(fb)
                         fb16[fb_word] = color
 
+    # Fast path of draw_ch_blit() for unrotated characters on MONO_HLSB
+    # framebuffers whose width is a multiple of 8, which is what almost all
+    # text is. Instead of going pixel by pixel, each byte of a glyph row is
+    # shifted into (at most) two framebuffer bytes and OR-ed in (or cleared,
+    # for color 0) as a mask. The glyph is clipped once, up front, to the
+    # rows and bytes that land inside the framebuffer.
+    @micropython.viper
+    def draw_ch_hlsb(self, fb:ptr8, fb_width:int, fb_height:int, ch_buf:ptr8, ch_width:int, ch_height:int, dst_x:int, dst_y:int, color:int):
+        fb_stride = fb_width >> 3
+        ch_stride = ch_width >> 3
+        shift = dst_x & 7
+        bx0 = dst_x >> 3 # Framebuffer byte of the glyph's first column.
+        # Clip rows.
+        y = 0
+        if dst_y < 0:
+            y = 0 - dst_y
+        y_end = ch_height
+        if dst_y + y_end > fb_height:
+            y_end = fb_height - dst_y
+        # Clip glyph bytes: byte j lands in framebuffer bytes bx0+j and,
+        # if shifted, bx0+j+1.
+        j0 = 0
+        if bx0 < -1:
+            j0 = -1 - bx0
+        j1 = ch_stride
+        if bx0 + j1 > fb_stride:
+            j1 = fb_stride - bx0
+        while y < y_end:
+            src = y * ch_stride
+            dst = (dst_y + y) * fb_stride + bx0
+            j = j0
+            while j < j1:
+                b = ch_buf[src + j]
+                if b:
+                    hi = b >> shift
+                    if hi and bx0 + j >= 0:
+                        if color:
+                            fb[dst + j] = fb[dst + j] | hi
+                        else:
+                            fb[dst + j] = fb[dst + j] & (0xff ^ hi)
+                    lo = (b << (8 - shift)) & 0xff
+                    if lo and bx0 + j + 1 < fb_stride:
+                        if color:
+                            fb[dst + j + 1] = fb[dst + j + 1] | lo
+                        else:
+                            fb[dst + j + 1] = fb[dst + j + 1] & (0xff ^ lo)
+                j += 1
+            y += 1
+
     # Write a character in the destination MicroPython framebuffer 'fb'
     # setting all the pixels that are set on the font to 'color'.
     # The character 'ch' must be obtained with the get_ch() method.
@@ -170,7 +411,9 @@ class MicroFont:
 
         # Call the lower level function depending on the target
         # framebuffer color mode.
-        if fb_fmt == framebuf.MONO_HLSB:
+        if fb_fmt == framebuf.MONO_HLSB and rot == 0 and not fb_width & 7:
+            self.draw_ch_hlsb(fb,fb_width,fb_height,ch_buf,ch_width,ch_height,dst_x+off_x,dst_y+off_y,color)
+        elif fb_fmt == framebuf.MONO_HLSB:
             fb_len = fb_width*fb_height//8
             self.draw_ch_blit(fb,fb_width,fb_len,ch_buf,ch_width,ch_height,dst_x,dst_y,off_x,off_y,color,sin,cos,COLORMODE_MONO_HLSB)
         elif fb_fmt == framebuf.RGB565:
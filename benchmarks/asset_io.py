@@ -0,0 +1,108 @@
+"""
+Compares loading assets the old way (read() into new bytes objects, PBMs inverted through a generator,
+the font index re-read for every non-ASCII glyph) against the assetio scratch arena (readinto borrowed
+memoryviews), for a mix of what the home screen and nice_text do: app icons that are drawn once and
+dropped, and glyphs that miss the glyph cache.
+For each, prints the bytes allocated per round with the GC off, the number of collections over many
+rounds with a small GC threshold, and micropython.mem_info() afterwards.
+"""
+import sys
+sys.path.append("Code")
+
+import gc
+import micropython
+import framebuf
+import assetio
+import internal_os.assets as assets
+from microfont import MicroFont, glyph_cache
+
+ROUNDS = 200
+GC_THRESHOLD = 4096
+
+ICONS = [
+    "Code/apps/badge/badge-icon.pbm",
+    "Code/apps/2048/2048.pbm",
+    "Code/apps/celeste/celeste-classic.pbm",
+    "Code/apps/coin-flip/coin-icon.pbm",
+    "Code/icon.pbm",
+]
+TEXT = "Hi μπω"
+FONT = "Code/fonts/victor_B_24.mfnt"
+
+def old_icon(path):
+    # badge.display.import_pbm before assetio
+    with open(path, "rb") as f:
+        f.readline()
+        dimensions = f.readline()
+        while dimensions.startswith(b"#"):
+            dimensions = f.readline()
+        width, height = map(int, dimensions.split())
+        pixel_data = bytearray(~b & 0xFF for b in f.read())
+    return framebuf.FrameBuffer(pixel_data, width, height, framebuf.MONO_HLSB)
+
+def old_glyph(stream, index_len, code):
+    # MicroFont.get_ch before assetio, for a character outside of printable ASCII
+    stream.seek(12)
+    index = stream.read(index_len)
+    doff = 0
+    for i in range(0, len(index) & ~3, 4):
+        if index[i] | index[i + 1] << 8 == code:
+            doff = (index[i + 2] | index[i + 3] << 8) << 3
+            break
+    stream.seek(12 + index_len + doff)
+    width = stream.read(2)
+    width = width[0] | width[1] << 8
+    return stream.read((width + 7) // 8 * 26)
+
+def round_old(stream, index_len, target):
+    for path in ICONS:
+        target.blit(old_icon(path), 0, 0)
+    for c in TEXT:
+        old_glyph(stream, index_len, ord(c))
+
+def round_new(font, target):
+    arena = assetio.scratch()
+    for path in ICONS:
+        mark = arena.mark()
+        target.blit(assets.load_pbm(path, arena), 0, 0)
+        arena.release(mark)
+    glyph_cache.clear()  # make every glyph a miss, like the old path
+    for c in TEXT:
+        font.get_ch(c)
+
+def allocated(fn):
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    fn()
+    after = gc.mem_alloc()
+    gc.enable()
+    return after - before
+
+def collections(fn):
+    gc.collect()
+    gc.threshold(GC_THRESHOLD)
+    count = 0
+    last = gc.mem_alloc()
+    for _ in range(ROUNDS):
+        fn()
+        now = gc.mem_alloc()
+        if now < last:
+            count += 1
+        last = now
+    gc.threshold(-1)
+    return count
+
+target_buf = bytearray(25 * 200)
+target = framebuf.FrameBuffer(target_buf, 200, 200, framebuf.MONO_HLSB)
+font = MicroFont(FONT)
+stream = open(FONT, "rb")
+
+for name, fn in (("read()", lambda: round_old(stream, font.index_len, target)), ("assetio", lambda: round_new(font, target))):
+    fn()  # warm up: open files, build the ASCII offset table...
+    per_round = allocated(fn)
+    count = collections(fn)
+    print(f"{name:>8}: {per_round} bytes allocated per round, {count} collections in {ROUNDS} rounds")
+    micropython.mem_info()
+
+print(f"arena: {assetio.scratch().stats()}")
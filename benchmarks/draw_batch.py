@@ -0,0 +1,85 @@
+"""
+Compares drawing a Celeste-like frame (a few hundred 12x12 tiles plus some 8x8 text) through the
+per-call badge.display API against a DrawList run in one call.
+The per-call path is reproduced with the same app check badge.display does on every primitive
+(get_current_app_repr() and an AppRepr comparison) in front of the FrameBuffer call.
+"""
+import sys
+sys.path.append("Code")
+
+import framebuf
+import time
+from internal_os.hardware.drawlist import DrawList, run
+
+WIDTH = 200
+HEIGHT = 200
+FRAMES = 50
+
+class FakeAppRepr:
+    def __init__(self, app_path):
+        self.app_path = app_path
+
+    def __eq__(self, value):
+        if not isinstance(value, FakeAppRepr):
+            return NotImplemented
+        return self.app_path == value.app_path
+
+class FakeAppManager:
+    def __init__(self):
+        self.selected_fg_app = FakeAppRepr("/apps/celeste")
+
+    def get_current_app_repr(self):
+        return self.selected_fg_app
+
+apps = FakeAppManager()
+buf = bytearray(WIDTH // 8 * HEIGHT)
+fb = framebuf.FrameBuffer(buf, WIDTH, HEIGHT, framebuf.MONO_HLSB)
+
+def _is_display_allowed():
+    return apps.get_current_app_repr() == apps.selected_fg_app
+
+def fill_rect(x, y, w, h, color):
+    if not _is_display_allowed():
+        raise RuntimeError("Cannot call display functions from a backgrounded app context.")
+    fb.fill_rect(x, y, w, h, color)
+
+def text(s, x, y, color=0):
+    if not _is_display_allowed():
+        raise RuntimeError("Cannot call display functions from a backgrounded app context.")
+    fb.text(s, x, y, color)
+
+# a checkerboard-ish room: about 200 solid tiles and 10 objects
+TILES = [(4 + c * 12, 4 + r * 12) for r in range(16) for c in range(16) if (r * 7 + c * 3) % 5 < 4]
+OBJECTS = [(4 + i * 18, 100) for i in range(10)]
+
+def frame_per_call():
+    for x, y in TILES:
+        fill_rect(x, y, 12, 12, 0)
+    for x, y in OBJECTS:
+        text(":D", x, y, 0)
+
+dl = DrawList(capacity=len(TILES) + len(OBJECTS))
+
+def frame_batched():
+    for x, y in TILES:
+        dl.fill_rect(x, y, 12, 12, 0)
+    for x, y in OBJECTS:
+        dl.text(":D", x, y, 0)
+    if not _is_display_allowed():
+        raise RuntimeError("Cannot call display functions from a backgrounded app context.")
+    run(dl, fb, buf, WIDTH, HEIGHT)
+    dl.clear()
+
+def bench(name, frame):
+    fb.fill(1)
+    frame()  # warm up (and grow any buffers)
+    start = time.ticks_us()
+    for _ in range(FRAMES):
+        frame()
+    elapsed = time.ticks_diff(time.ticks_us(), start)
+    print(f"{name:>9}: {elapsed // FRAMES} us/frame ({len(TILES) + len(OBJECTS)} commands)")
+    return bytes(buf)
+
+per_call = bench("per-call", frame_per_call)
+batched = bench("DrawList", frame_batched)
+print("identical output:", per_call == batched)
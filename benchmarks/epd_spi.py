@@ -0,0 +1,95 @@
+"""
+Counts the SPI traffic of a single EPD frame upload.
+Reports bytes, CS-asserted transactions, spi.write() calls and heap allocations per frame,
+for the bulk path in einkdriver and for the old one-transaction-per-byte loop.
+"""
+import sys
+sys.path.append("Code")
+
+import gc
+from internal_os.hardware.einkdriver import EPD, WRITE_RAM
+
+class CountingSPI:
+    def __init__(self):
+        self.writes = 0
+        self.bytes = 0
+
+    def write(self, buf):
+        self.writes += 1
+        self.bytes += len(buf)
+
+class FakePin:
+    OUT = 1
+    IN = 0
+    IRQ_FALLING = 4
+
+    def __init__(self):
+        self.state = 1
+        self.falling_edges = 0
+
+    def init(self, mode, value=None):
+        if value is not None:
+            self.state = value
+
+    def value(self, v=None):
+        if v is None:
+            return 0  # never busy
+        if self.state and not v:
+            self.falling_edges += 1
+        self.state = v
+
+    def irq(self, trigger=None, handler=None):
+        pass
+
+class BenchEPD(EPD):
+    # no panel to wait for
+    def reset(self):
+        pass
+
+    def wait_until_idle(self):
+        self.refreshing = False
+
+class LegacyEPD(BenchEPD):
+    def send_data(self, data):
+        self.dc.value(1)
+        self.cs.value(0)
+        self.spi.write(bytearray([data]))
+        self.cs.value(1)
+
+    def write_window(self, buffer, x_byte, y, w_bytes, h, stride):
+        for j in range(y, y + h):
+            for i in range(x_byte, x_byte + w_bytes):
+                self.send_data(buffer[i + j * stride])
+
+def measure(name, epd, fn):
+    spi = CountingSPI()
+    epd.spi = spi
+    epd.cs.falling_edges = 0
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    fn()
+    allocated = gc.mem_alloc() - before
+    gc.enable()
+    print(f"{name:<28} {spi.bytes:>7} B {epd.cs.falling_edges:>7} txns {spi.writes:>7} writes {allocated:>8} B alloc")
+
+def frame_upload(epd):
+    w = epd.width // 8
+    def run():
+        epd.send_command(WRITE_RAM)
+        epd.write_window(epd.buffer, 0, 0, w, epd.height, w)
+    return run
+
+def window_upload(epd):
+    w = epd.width // 8
+    def run():
+        epd.send_command(WRITE_RAM)
+        epd.write_window(epd.buffer, 3, 40, 6, 48, w)
+    return run
+
+for cls in (LegacyEPD, BenchEPD):
+    epd = cls(CountingSPI(), FakePin(), FakePin(), FakePin(), FakePin())
+    label = "per-byte" if cls is LegacyEPD else "bulk"
+    measure(f"{label} full frame", epd, frame_upload(epd))
+    measure(f"{label} 48x48 window", epd, window_upload(epd))
+    measure(f"{label} clear()", epd, epd.clear)
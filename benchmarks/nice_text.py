@@ -0,0 +1,69 @@
+"""
+Times rendering the badge app's contact layout (name, pronouns, handle and badge ID in
+nice fonts) with MicroFont's unrotated byte-mask path against the generic per-pixel
+draw_ch_blit() path, and checks that both produce the same pixels.
+Glyphs are fetched once up front, so only drawing is measured.
+"""
+import sys
+sys.path.append("Code")
+
+import framebuf
+import time
+from microfont import MicroFont, COLORMODE_MONO_HLSB
+
+WIDTH = 200
+HEIGHT = 200
+RUNS = 20
+
+def font(size_name):
+    return MicroFont(f"Code/fonts/victor_{size_name}.mfnt", cache_chars=True)
+
+# (text, font, x, y), roughly what apps/badge lays out for a typical contact
+LAYOUT = [
+    ("Ada\nLovelace", font("B_42"), 0, 0),
+    ("(she/her)", font("B_24"), 0, 80),
+    ("@countess", font("B_24"), 0, 116),
+    ("Badge ID: 0x1a2b", font("B_18"), 0, 170),
+]
+
+buf = bytearray(WIDTH // 8 * HEIGHT)
+fb = framebuf.FrameBuffer(buf, WIDTH, HEIGHT, framebuf.MONO_HLSB)
+
+def glyph_runs():
+    """Resolve every glyph once, as (font, glyph, x, y)"""
+    runs = []
+    for text, f, x, y in LAYOUT:
+        off_x = 0
+        off_y = 0
+        for c in text:
+            if c == "\n":
+                off_y += f.height
+                off_x = 0
+                continue
+            ch = f.get_ch(c)
+            runs.append((f, ch, x + off_x, y + off_y))
+            off_x += ch[2]
+    return runs
+
+RUNS_GLYPHS = glyph_runs()
+
+def render_generic():
+    for f, ch, x, y in RUNS_GLYPHS:
+        f.draw_ch_blit(fb, WIDTH, len(buf), ch[0], ((ch[2] + 7) // 8) * 8, ch[1], x, y, 0, 0, 0, 0, 64, COLORMODE_MONO_HLSB)
+
+def render_fast():
+    for f, ch, x, y in RUNS_GLYPHS:
+        f.draw_ch_hlsb(fb, WIDTH, HEIGHT, ch[0], ((ch[2] + 7) // 8) * 8, ch[1], x, y, 0)
+
+def bench(name, render):
+    fb.fill(1)
+    start = time.ticks_us()
+    for _ in range(RUNS):
+        render()
+    elapsed = time.ticks_diff(time.ticks_us(), start) // RUNS
+    print(f"{name:>8}: {elapsed} us per layout ({len(RUNS_GLYPHS)} glyphs)")
+    return elapsed, bytes(buf)
+
+generic_us, generic_out = bench("generic", render_generic)
+fast_us, fast_out = bench("rot-0", render_fast)
+print(f"speedup: {generic_us / max(fast_us, 1):.1f}x, identical output: {generic_out == fast_out}")
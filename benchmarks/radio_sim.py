@@ -0,0 +1,133 @@
+"""
+Simulates a hall full of badges sharing the radio channel, with and without listen-before-talk,
+and prints the goodput (packets received without a collision per second) for each.
+Every badge broadcasts packets of random size at random intervals and hears every other badge.
+A packet is lost if any other transmission overlaps it (no capture effect). With LBT, a badge runs
+CAD before each transmit and backs off with internal_os.hardware.lbt, exactly like BadgeRadio;
+CAD misses a transmission that starts while it's running, or during the switch from CAD to transmit.
+Pure Python with a simulated clock, so it also runs on CPython:
+    python3 benchmarks/radio_sim.py
+"""
+import sys
+sys.path.append("Code")
+
+import heapq
+import random
+from internal_os.hardware.lbt import ListenBeforeTalk
+
+SECONDS = 600
+BADGE_COUNTS = (4, 8, 16, 32, 64)
+MEAN_INTERVAL_MS = 3000  # average time between two packets of a badge
+HEADER_SIZE = 6
+MAX_PAYLOAD = 249
+CAD_MS = 1  # CAD at SF7/500 kHz: 2 symbols of 256 us plus processing
+TURNAROUND_MS = 1  # from the end of CAD to the start of the transmission
+SEED = 1
+
+def time_on_air_ms(length):
+    # SX126X.getTimeOnAir for the badge's modulation: SF7, 500 kHz, CR 4/8, 8 symbol preamble, explicit header, CRC
+    sf = 7
+    symbol_us = (1000 * 10 << sf) // (500 * 10)
+    bits = max(0, 8 * length + 16 - 4 * sf + 8 + 20)
+    symbols = (bits + 4 * sf - 1) // (4 * sf)
+    symbols_x4 = (8 + 8) * 4 + 17 + symbols * 8 * 4
+    return symbol_us * symbols_x4 / 4 / 1000
+
+class Badge:
+    def __init__(self):
+        self.queue = []  # time on air of the packets waiting
+        self.attempt = 0
+        self.busy = False  # a send is in progress: CAD, backoff or transmission
+        self.lbt = ListenBeforeTalk()
+
+def simulate(badge_count, use_lbt):
+    random.seed(SEED)
+    badges = [Badge() for _ in range(badge_count)]
+    events = []  # (time, sequence, kind, badge index or transmission id for "end")
+    sequence = 0
+    on_air = {}  # transmission id -> [start, end, collided, badge index], until it ends
+    next_id = 0
+    sent = delivered = dropped = 0
+    stats = {"checks": 0, "busy": 0, "retries": 0, "gave_up": 0}
+
+    def schedule(t, kind, i):
+        nonlocal sequence
+        heapq.heappush(events, (t, sequence, kind, i))
+        sequence += 1
+
+    for i in range(badge_count):
+        schedule(random.expovariate(1 / MEAN_INTERVAL_MS), "arrival", i)
+
+    end = SECONDS * 1000
+    while events:
+        t, _, kind, i = heapq.heappop(events)
+        if t > end:
+            break
+        if kind == "end":
+            _, _, collided, owner = on_air.pop(i)
+            if not collided:
+                delivered += 1
+            schedule(t, "done", owner)
+            continue
+        badge = badges[i]
+        if kind == "arrival":
+            badge.queue.append(time_on_air_ms(HEADER_SIZE + random.randint(1, MAX_PAYLOAD)))
+            schedule(t + random.expovariate(1 / MEAN_INTERVAL_MS), "arrival", i)
+            if not badge.busy:
+                badge.busy = True
+                schedule(t, "attempt", i)
+        elif kind == "attempt":
+            start = t
+            if use_lbt:
+                badge.lbt.checks += 1
+                if badge.attempt:
+                    badge.lbt.retries += 1
+                # CAD only hears transmissions that were already on air when it started
+                if any(tx_start <= t < tx_end for tx_start, tx_end, _, _ in on_air.values()):
+                    badge.lbt.busy += 1
+                    badge.attempt += 1
+                    if badge.attempt < badge.lbt.max_attempts:
+                        schedule(t + CAD_MS + badge.lbt.backoff_ms(badge.attempt - 1), "attempt", i)
+                        continue
+                    badge.lbt.gave_up += 1
+                    badge.queue.pop(0)
+                    dropped += 1
+                    schedule(t + CAD_MS, "done", i)
+                    continue
+                start = t + CAD_MS + TURNAROUND_MS
+            airtime = badge.queue.pop(0)
+            collided = False
+            for tx in on_air.values():
+                if tx[0] < start + airtime and tx[1] > start:
+                    tx[2] = True
+                    collided = True
+            on_air[next_id] = [start, start + airtime, collided, i]
+            schedule(start + airtime, "end", next_id)
+            next_id += 1
+            sent += 1
+        elif kind == "done":
+            badge.attempt = 0
+            if badge.queue:
+                schedule(t, "attempt", i)
+            else:
+                badge.busy = False
+
+    for badge in badges:
+        for key, value in badge.lbt.stats().items():
+            stats[key] += value
+    return sent, delivered, dropped, stats
+
+def main():
+    mean_airtime = sum(time_on_air_ms(HEADER_SIZE + n) for n in range(1, MAX_PAYLOAD + 1)) / MAX_PAYLOAD
+    print(f"{SECONDS} s, one packet every {MEAN_INTERVAL_MS} ms per badge on average, {mean_airtime:.1f} ms mean time on air")
+    print(f"{'badges':>6} {'load':>5} | {'ALOHA goodput':>13} {'delivered':>9} | {'LBT goodput':>11} {'delivered':>9} {'CAD busy':>8} {'retries':>7} {'gave up':>7}")
+    for badge_count in BADGE_COUNTS:
+        load = badge_count * mean_airtime / MEAN_INTERVAL_MS
+        sent, delivered, _, _ = simulate(badge_count, False)
+        aloha = f"{delivered / SECONDS:>9.2f} p/s {delivered / max(sent, 1):>9.0%}"
+        sent, delivered, dropped, stats = simulate(badge_count, True)
+        offered = sent + dropped
+        lbt = f"{delivered / SECONDS:>7.2f} p/s {delivered / max(offered, 1):>9.0%} {stats['busy']:>8} {stats['retries']:>7} {stats['gave_up']:>7}"
+        print(f"{badge_count:>6} {load:>5.2f} | {aloha} | {lbt}")
+
+main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Pack the PBM images of the firmware into a single asset bundle, so the badge can load them with one
+readinto() each instead of parsing and inverting PBMs at runtime. See Code/internal_os/assets.py for the loader.
+
+Bundle layout (little endian):
+    header:  magic b"ABN2", u16 entry count, u16 reserved
+    entries: u16 width, u16 height, u16 row stride in bytes, u32 data offset, u32 size of the source PBM,
+             u32 CRC-32 of the source PBM, u8 name length, name (the image's path on the badge, e.g.
+             "/apps/badge/badge-icon.pbm")
+    data:    one bitmap per entry, MONO_HLSB with 1 = white (the PBM bits inverted for the e-ink display),
+             every row padded to whole bytes, every bitmap starting on a 4-byte boundary
+
+Usage, from the root of the repository:
+    python3 tools/pack_assets.py Code -o Code/build/assets.bin
+"""
+import argparse
+import os
+import struct
+import sys
+import zlib
+
+MAGIC = b"ABN2"
+HEADER = "<4sHH"
+ENTRY = "<HHHIIIB"
+ALIGN = 4
+
+def read_token(data: bytes, pos: int):
+    """Read a whitespace-separated header token of a PBM, skipping comments. Returns (token, position after it)."""
+    while True:
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 1] == b"#":
+            pos = data.index(b"\n", pos)
+            continue
+        break
+    start = pos
+    while pos < len(data) and not data[pos:pos + 1].isspace() and data[pos:pos + 1] != b"#":
+        pos += 1
+    return data[start:pos], pos
+
+def read_pbm(path: str):
+    """Read a binary (P4) PBM. Returns (width, height, stride, inverted bitmap, CRC-32 of the file)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, pos = read_token(data, 0)
+    if magic != b"P4":
+        raise ValueError(f"{path} is not a binary PBM file")
+    width, pos = read_token(data, pos)
+    height, pos = read_token(data, pos)
+    width, height = int(width), int(height)
+    pos += 1  # a single whitespace character separates the header from the bitmap
+    stride = (width + 7) // 8
+    bitmap = data[pos:pos + stride * height]
+    if len(bitmap) != stride * height:
+        raise ValueError(f"{path}: pixel data does not match its {width}x{height} size")
+    # the e-ink display uses 1 for white, PBM uses 1 for black
+    return width, height, stride, bytes(~b & 0xFF for b in bitmap), zlib.crc32(data)
+
+def find_pbms(root: str):
+    """Find the PBM files under root, as (path on the host, path on the badge), skipping build output."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != "build")
+        for filename in sorted(filenames):
+            if filename.endswith(".pbm"):
+                host_path = os.path.join(dirpath, filename)
+                found.append((host_path, "/" + os.path.relpath(host_path, root).replace(os.sep, "/")))
+    return found
+
+def pack(images) -> bytes:
+    """Build a bundle from a list of (name, source size, source CRC-32, width, height, stride, bitmap)."""
+    offset = struct.calcsize(HEADER) + sum(struct.calcsize(ENTRY) + len(image[0].encode()) for image in images)
+    table = b""
+    data = b""
+    for name, source_size, source_crc, width, height, stride, bitmap in images:
+        padding = -(offset + len(data)) % ALIGN
+        data += bytes(padding)
+        name = name.encode()
+        table += struct.pack(ENTRY, width, height, stride, offset + len(data), source_size, source_crc, len(name)) + name
+        data += bitmap
+    return struct.pack(HEADER, MAGIC, len(images), 0) + table + data
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Pack PBM images into an asset bundle for the badge.")
+    parser.add_argument("root", help="directory that is uploaded to the badge (usually Code)")
+    parser.add_argument("-o", "--output", required=True, help="bundle file to write")
+    args = parser.parse_args()
+
+    images = []
+    for host_path, name in find_pbms(args.root):
+        try:
+            width, height, stride, bitmap, crc = read_pbm(host_path)
+        except ValueError as e:
+            print(f"Skipping {host_path}: {e}", file=sys.stderr)
+            continue
+        images.append((name, os.path.getsize(host_path), crc, width, height, stride, bitmap))
+        print(f"Packed {name} ({width}x{height})")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "wb") as f:
+        f.write(pack(images))
+    print(f"Wrote {len(images)} images to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())